@@ -0,0 +1,61 @@
+"""
+Wall-clock scaling of the process-parallel transcription mode.
+
+Usage:
+    python benchmarks/parallel_asr.py input.mp4 --workers 1 2 4 --threads 2
+
+For every worker count the input is transcribed twice with a fresh pool: the
+cold run includes the per-worker model load, the warm run reuses the pool the
+way a warm Cloud Run instance would.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.whisper_gen import probe_duration
+from scripts.parallel_asr import transcribe_parallel, shutdown_pool
+
+
+def run_once(input_file, model_name, compute_type, workers, threads):
+    output_folder = tempfile.mkdtemp(prefix="bench_parallel_asr_")
+    try:
+        started = time.perf_counter()
+        transcribe_parallel(input_file, output_folder, model_name, compute_type, workers=workers, threads=threads)
+        return time.perf_counter() - started
+    finally:
+        shutil.rmtree(output_folder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_file")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=None, help="ctranslate2 threads per worker (default: cores / workers)")
+    parser.add_argument("--model", default=os.getenv('WHISPER_MODEL_NAME', 'tiny'))
+    parser.add_argument("--compute-type", default="int8")
+    args = parser.parse_args()
+
+    duration = probe_duration(args.input_file) or 0.0
+    rows = []
+    for workers in args.workers:
+        shutdown_pool()
+        cold = run_once(args.input_file, args.model, args.compute_type, workers, args.threads)
+        warm = run_once(args.input_file, args.model, args.compute_type, workers, args.threads)
+        rows.append((workers, cold, warm))
+    shutdown_pool()
+
+    baseline = rows[0][2]
+    print(f"\nInput: {args.input_file} ({duration:.1f}s of audio), model={args.model}")
+    print(f"{'workers':>8} {'cold s':>10} {'warm s':>10} {'audio-s/s':>10} {'speedup':>8}")
+    for workers, cold, warm in rows:
+        rate = duration / warm if warm > 0 else 0.0
+        print(f"{workers:>8} {cold:>10.2f} {warm:>10.2f} {rate:>10.2f} {baseline / warm:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Offline timing of the segment-selection stage on synthetic transcripts.
+
+Usage:
+    python benchmarks/segment_selection.py --hours 1 2 3 4 5 --clips 5
+
+For each length a deterministic transcript with word timings is written to a
+scratch workspace and run through prompt building (pre-ranking, compaction,
+chunking), the heuristic LLM backend, response parsing and the top-K
+post-processor. No network access or model is needed.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts import create_viral_segments, transcript_format, select_segments
+from scripts.llm_backends import HeuristicBackend
+from scripts.segment_schema import parse_document
+
+VOCABULARY = (
+    "the a we you they this that what really never always people time video game "
+    "money question answer story crazy funny honestly actually think know believe"
+).split()
+
+
+def synthetic_transcript(hours, seed=0):
+    """
+    Builds a whisperx-style transcript of the given length: sentences of 4-20
+    words at a varying speaking rate, separated by pauses, with the odd
+    exclamation or question and occasional long silences.
+    """
+    rng = random.Random(seed)
+    segments = []
+    t = 0.0
+    end_of_video = hours * 3600
+    while t < end_of_video:
+        words = []
+        rate = rng.uniform(1.5, 4.0)
+        for _ in range(rng.randint(4, 20)):
+            length = 1.0 / rate
+            words.append({"word": rng.choice(VOCABULARY), "start": round(t, 3), "end": round(t + length * 0.8, 3), "score": 0.9})
+            t += length
+        words[-1]["word"] += rng.choice([".", ".", ".", "!", "?"])
+        segments.append({
+            "start": words[0]["start"],
+            "end": words[-1]["end"],
+            "text": " ".join(w["word"] for w in words),
+            "words": words,
+        })
+        t += rng.expovariate(1.0) if rng.random() > 0.02 else rng.uniform(20, 90)
+    return {"segments": segments, "word_segments": [w for s in segments for w in s["words"]], "language": "en"}
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def run_once(hours, clips, min_seconds, max_seconds):
+    transcript = synthetic_transcript(hours)
+    with open("tmp/input_video.json", "w", encoding="utf-8") as f:
+        json.dump(transcript, f)
+    with open("tmp/input_video.tsv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(["start", "end", "text"])
+        writer.writerows([s["start"], s["end"], s["text"]] for s in transcript["segments"])
+
+    lines, load_ms = timed(transcript_format.load_transcript_lines)
+    compact, compact_ms = timed(transcript_format.compact_transcript, lines)
+    _, chunk_ms = timed(create_viral_segments.chunk_transcript, compact)
+    prompts, build_ms = timed(create_viral_segments.build_chunk_prompts, clips, "", min_seconds, max_seconds, None)
+
+    backend = HeuristicBackend()
+    responses, llm_ms = timed(lambda: [backend.generate(prompt) for prompt in prompts])
+    documents, parse_ms = timed(lambda: [parse_document(text).to_dict() for text in responses])
+    segments = [segment for document in documents for segment in document["segments"]]
+    chosen, select_ms = timed(select_segments.select_top_segments, segments, clips, min_seconds, max_seconds)
+
+    return {
+        "hours": hours,
+        "lines": len(lines),
+        "prompt_chars": sum(len(p) for p in prompts),
+        "chunks": len(prompts),
+        "load": load_ms,
+        "compact": compact_ms,
+        "chunking": chunk_ms,
+        "build": build_ms,
+        "llm": llm_ms,
+        "parse": parse_ms,
+        "select": select_ms,
+        "chosen": len(chosen),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 2, 3, 4, 5])
+    parser.add_argument("--clips", type=int, default=5)
+    parser.add_argument("--min-duration", type=int, default=15)
+    parser.add_argument("--max-duration", type=int, default=60)
+    parser.add_argument("--no-prerank", action="store_true", help="send the whole transcript instead of pre-ranked windows")
+    args = parser.parse_args()
+
+    os.environ["PRERANK_ENABLED"] = "false" if args.no_prerank else "true"
+    os.environ["GEMINI_CACHE_ENABLED"] = "false"
+
+    workspace = tempfile.mkdtemp(prefix="bench_segment_selection_")
+    cwd = os.getcwd()
+    rows = []
+    try:
+        os.chdir(workspace)
+        os.makedirs("tmp", exist_ok=True)
+        for hours in args.hours:
+            rows.append(run_once(hours, args.clips, args.min_duration, args.max_duration))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    print(f"\nclips={args.clips}, duration {args.min_duration}-{args.max_duration}s, prerank={'off' if args.no_prerank else 'on'} (times in ms)")
+    print(f"{'hours':>6} {'lines':>7} {'chars':>9} {'chunks':>6} {'load':>8} {'compact':>8} {'chunking':>9} "
+          f"{'build':>8} {'llm':>8} {'parse':>8} {'select':>8} {'kept':>5}")
+    for r in rows:
+        print(f"{r['hours']:>6g} {r['lines']:>7} {r['prompt_chars']:>9} {r['chunks']:>6} {r['load']:>8.1f} {r['compact']:>8.1f} "
+              f"{r['chunking']:>9.1f} {r['build']:>8.1f} {r['llm']:>8.1f} {r['parse']:>8.1f} {r['select']:>8.1f} {r['chosen']:>5}")
+
+
+if __name__ == "__main__":
+    main()
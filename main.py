@@ -5,6 +5,8 @@ import tempfile
 import contextlib
 import math
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import functions_framework
 from flask import jsonify
 import firebase_admin
@@ -247,14 +249,16 @@ def createShortsJob(request):
         from google import genai
         from scripts.credits_manager import get_credit_costs
         from scripts.change_run_status import ChangeDDBBStatus
-        from scripts.whisper_gen import generate_whisperx
+        from scripts.whisper_gen import generate_whisperx, stage_model_name
         from scripts import (
             download_video, 
             create_viral_segments, 
             cut_segments, 
+            slice_transcript, 
             transcribe_cuts, 
             adjust_subtitles, 
-            burn_subtitles
+            burn_subtitles,
+            llm_backends
         )
         from scripts.credits_manager import check_credits_transaction, consume_credits_transaction, refund_credits_transaction
 
@@ -269,6 +273,11 @@ def createShortsJob(request):
     except Exception as e:
         print(f"Warning: GenAI Client init failed: {e}")
         client = None
+    try:
+        client = llm_backends.backend_from_env(client)
+    except Exception as e:
+        print(f"Warning: LLM backend selection failed, using the GenAI client: {e}")
+        client = llm_backends.as_backend(client)
 
     total_reserved_videos = 0
     successful_videos = 0
@@ -338,6 +347,88 @@ def createShortsJob(request):
             required_folders = ['tmp', 'subs', 'subs_ass', 'burned_sub', 'videos']
                 
             bucket = storage.bucket()
+
+            discovery_model = stage_model_name('discovery')
+            subtitle_model = stage_model_name('subtitles')
+
+            def adjust_subs(filenames=None):
+                adjust_subtitles.adjust(
+                    current_style_config['base_color'], 
+                    current_style_config['base_size'], 
+                    current_style_config['h_size'], 
+                    current_style_config['highlight_color'], 
+                    current_style_config['palavras_por_bloco'], 
+                    current_style_config['limite_gap'], 
+                    current_style_config['modo'], 
+                    current_style_config['posicao_vertical'], 
+                    current_style_config['alinhamento'], 
+                    current_style_config['fonte'], 
+                    current_style_config['contorno'], 
+                    current_style_config['cor_da_sombra'], 
+                    current_style_config['negrito'],
+                    current_style_config['italico'],
+                    current_style_config['sublinhado'],
+                    current_style_config['tachado'],
+                    current_style_config['estilo_da_borda'],
+                    current_style_config['espessura_do_contorno'],
+                    current_style_config['tamanho_da_sombra'],
+                    filenames=filenames
+                )
+
+            # Fused rendering seeks into the source video while burning, so no intermediate cut is encoded.
+            fused_render = burn_subtitles.fused_render_enabled()
+            render_source = 'tmp/input_video.mp4' if fused_render else None
+
+            upload_lock = threading.Lock()
+
+            def upload_short(fpath):
+                unique_id = str(uuid.uuid4())
+                file_name = f"short_{unique_id}.mp4"
+                blob_path = f"users/{user_id}/{savingCollection}/{short_build_id}/{file_name}"
+
+                blob = bucket.blob(blob_path)
+                blob.upload_from_filename(fpath)
+
+                media_data = {
+                    "url": blob_path,
+                    "mimeType": "video/mp4",
+                    "type": "generated",
+                    "generatedAt": firestore.SERVER_TIMESTAMP
+                }
+
+                doc_ref.set({
+                    "shorts": { unique_id: media_data },
+                    "lastUpdatedAt": firestore.SERVER_TIMESTAMP
+                }, merge=True)
+
+            def render_clip(index, segment):
+                # Uploads the short as soon as it is burned, so it reaches the
+                # user while the remaining segments are still streaming in.
+                nonlocal successful_videos
+                try:
+                    if not fused_render:
+                        cut_segments.cut_segment(index, segment)
+                    if subtitle_model == discovery_model:
+                        slice_transcript.slice_transcript([segment], transcript_path='tmp/input_video.json', output_folder='subs', first_index=index)
+                    else:
+                        # The leased model is exclusive, so concurrent clips take turns on it.
+                        transcribe_cuts.transcribe_segments([segment], source_file='tmp/input_video.mp4', output_folder='subs', model_name=subtitle_model, first_index=index)
+                    adjust_subs([f"output{str(index).zfill(3)}_original_scale.json"])
+                    burn_subtitles.burn_segment(
+                        index, segment,
+                        optional_header=optional_header,
+                        font_size=100,
+                        channel_name=watermark_text,
+                        aspect_ratio=aspect_ratio,
+                        source_video=render_source
+                    )
+                    fpath = f"burned_sub/final-output{str(index).zfill(3)}_processed.mp4"
+                    if os.path.exists(fpath):
+                        upload_short(fpath)
+                        with upload_lock:
+                            successful_videos += 1
+                except Exception as e:
+                    print(f"Error rendering clip {index}: {e}")
             
             for vid_url in urls:
                 for folder in required_folders:
@@ -352,82 +443,81 @@ def createShortsJob(request):
                         raise FileNotFoundError("Video download failed")
                     
                     shutil.copy2(input_video_path, "tmp/input_video.mp4")
-                    
-                    generate_whisperx("tmp/input_video.mp4", 'tmp')
-                    
-                    viral_data = create_viral_segments.create_viral_segments(
-                        num_segments=num_clips, 
-                        instructions=instructions, 
-                        tempo_minimo=min_duration, 
-                        tempo_maximo=max_duration, 
-                        client=client,
-                        generate_title=generate_title
-                    )
-                    
-                    if not viral_data or "segments" not in viral_data or not viral_data["segments"]:
-                        print(f"No viral segments found for {vid_url}")
-                        continue
 
-                    cut_segments.cut(viral_data["segments"])
-                    
-                    transcribe_cuts.transcribe(input_folder='tmp', output_folder='subs')
-                    
-                    adjust_subtitles.adjust(
-                        current_style_config['base_color'], 
-                        current_style_config['base_size'], 
-                        current_style_config['h_size'], 
-                        current_style_config['highlight_color'], 
-                        current_style_config['palavras_por_bloco'], 
-                        current_style_config['limite_gap'], 
-                        current_style_config['modo'], 
-                        current_style_config['posicao_vertical'], 
-                        current_style_config['alinhamento'], 
-                        current_style_config['fonte'], 
-                        current_style_config['contorno'], 
-                        current_style_config['cor_da_sombra'], 
-                        current_style_config['negrito'],
-                        current_style_config['italico'],
-                        current_style_config['sublinhado'],
-                        current_style_config['tachado'],
-                        current_style_config['estilo_da_borda'],
-                        current_style_config['espessura_do_contorno'],
-                        current_style_config['tamanho_da_sombra']
+                    generate_whisperx(
+                        "tmp/input_video.mp4", 'tmp',
+                        cache_prefix=download_video.source_cache_prefix(vid_url, 'transcripts'),
+                        model_name=discovery_model
                     )
                     
-                    burn_subtitles.burn_with_title_and_channel(
-                        optional_header=optional_header, 
-                        segments=viral_data["segments"], 
-                        font_size=100, 
-                        channel_name=watermark_text,
-                        aspect_ratio=aspect_ratio
-                    )
+                    gemini_cache_prefix = download_video.source_cache_prefix(vid_url, 'gemini')
+
+                    if os.getenv('SEGMENT_STREAMING', 'false').lower() == 'true':
+                        # Each clip is cut, subtitled, burned and uploaded as soon as its segment streams in.
+                        with ThreadPoolExecutor(max_workers=int(os.getenv('CLIP_RENDER_WORKERS', '2'))) as clip_executor:
+                            clip_futures = []
+                            viral_data = create_viral_segments.create_viral_segments_streaming(
+                                num_segments=num_clips,
+                                instructions=instructions,
+                                tempo_minimo=min_duration,
+                                tempo_maximo=max_duration,
+                                client=client,
+                                on_segment=lambda index, segment: clip_futures.append(
+                                    clip_executor.submit(render_clip, index, segment)
+                                ),
+                                generate_title=generate_title,
+                                cache_prefix=gemini_cache_prefix
+                            )
+                            for future in clip_futures:
+                                future.result()
+
+                        if not viral_data or not viral_data.get("segments"):
+                            print(f"No viral segments found for {vid_url}")
+                            continue
+                    else:
+                        viral_data = create_viral_segments.create_viral_segments(
+                            num_segments=num_clips, 
+                            instructions=instructions, 
+                            tempo_minimo=min_duration, 
+                            tempo_maximo=max_duration, 
+                            client=client,
+                            generate_title=generate_title,
+                            cache_prefix=gemini_cache_prefix
+                        )
+                        
+                        if not viral_data or "segments" not in viral_data or not viral_data["segments"]:
+                            print(f"No viral segments found for {vid_url}")
+                            continue
 
-                    generated_count_for_url = 0
-                    for i in range(len(viral_data["segments"])):
-                        fpath = f"burned_sub/final-output{str(i).zfill(3)}_processed.mp4"
+                        if not fused_render:
+                            cut_segments.cut(viral_data["segments"])
                         
-                        if os.path.exists(fpath):
-                            unique_id = str(uuid.uuid4())
-                            file_name = f"short_{unique_id}.mp4"
-                            blob_path = f"users/{user_id}/{savingCollection}/{short_build_id}/{file_name}"
-                            
-                            blob = bucket.blob(blob_path)
-                            blob.upload_from_filename(fpath)
-                            
-                            media_data = {
-                                "url": blob_path, 
-                                "mimeType": "video/mp4",
-                                "type": "generated",
-                                "generatedAt": firestore.SERVER_TIMESTAMP
-                            }
-                            
-                            doc_ref.set({
-                                "shorts": { unique_id: media_data },
-                                "lastUpdatedAt": firestore.SERVER_TIMESTAMP
-                            }, merge=True)
-                            generated_count_for_url += 1
-                    
-                    successful_videos += generated_count_for_url
+                        if subtitle_model == discovery_model:
+                            slice_transcript.slice_transcript(viral_data["segments"], transcript_path='tmp/input_video.json', output_folder='subs')
+                        else:
+                            # Pay for the accurate model only on the audio that becomes shorts.
+                            transcribe_cuts.transcribe_segments(viral_data["segments"], source_file='tmp/input_video.mp4', output_folder='subs', model_name=subtitle_model)
+                        
+                        adjust_subs()
+                        
+                        burn_subtitles.burn_with_title_and_channel(
+                            optional_header=optional_header, 
+                            segments=viral_data["segments"], 
+                            font_size=100, 
+                            channel_name=watermark_text,
+                            aspect_ratio=aspect_ratio,
+                            source_video=render_source
+                        )
+
+                        generated_count_for_url = 0
+                        for i in range(len(viral_data["segments"])):
+                            fpath = f"burned_sub/final-output{str(i).zfill(3)}_processed.mp4"
+
+                            if os.path.exists(fpath):
+                                upload_short(fpath)
+                                generated_count_for_url += 1
+
+                        successful_videos += generated_count_for_url
 
                 except Exception as inner_e:
                     print(f"Error processing video {vid_url}: {inner_e}")
@@ -511,11 +601,11 @@ def createSubtitlesJob(request):
 
     try:
         from scripts.change_run_status import ChangeDDBBStatus
-        from scripts.whisper_gen import generate_whisperx
+        from scripts.whisper_gen import generate_whisperx, generate_whisperx_batch, output_paths, stage_model_name
+        from scripts.stage_timer import StageTimer
         from scripts import (
             download_video,
             burn_subtitles,
-            transcribe_cuts,
             adjust_subtitles
         )
         from scripts.credits_manager import get_credit_costs
@@ -566,28 +656,31 @@ def createSubtitlesJob(request):
         with temporary_work_dir() as temp_dir:
             required_folders = ['tmp', 'subs', 'subs_ass', 'burned_sub'] 
             bucket = storage.bucket()
-            
-            for vid_url in urls:
-                for folder in required_folders:
-                    if os.path.exists(folder):
-                        shutil.rmtree(folder)
-                    os.makedirs(folder, exist_ok=True)
-
+            os.makedirs('inputs', exist_ok=True)
+            os.makedirs('transcripts', exist_ok=True)
+
+            # Download, probe and reserve credits for every input up front so
+            # all of them can share ASR batches in a single transcription pass.
+            prepared = []
+            for idx, vid_url in enumerate(urls):
+                timer = StageTimer(f"subtitles:{os.path.basename(vid_url)}")
                 try:
                     print(f"Downloading for subtitles: {vid_url}")
-                    input_video_path = download_video.download(vid_url)
+                    with timer.stage("download"):
+                        input_video_path = download_video.download(vid_url)
                     if not input_video_path or not os.path.exists(input_video_path):
                         print(f"Video download failed for {vid_url}")
                         continue
                     
-                    shutil.copy2(input_video_path, "tmp/output000_original_scale.mp4")
+                    local_input = f"inputs/input{str(idx).zfill(3)}.mp4"
+                    shutil.copy2(input_video_path, local_input)
 
                     cmd = [
                         'ffprobe', 
                         '-v', 'error', 
                         '-show_entries', 'format=duration', 
                         '-of', 'default=noprint_wrappers=1:nokey=1', 
-                        "tmp/output000_original_scale.mp4"
+                        local_input
                     ]
                     process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
                     try:
@@ -606,41 +699,91 @@ def createSubtitlesJob(request):
                         print(f"Insufficient credits for video {vid_url}: {ve}")
                         continue
 
-                    generate_whisperx("tmp/output000_original_scale.mp4", 'tmp')
+                    prepared.append({
+                        "url": vid_url,
+                        "input": local_input,
+                        "cache_prefix": download_video.source_cache_prefix(vid_url, 'transcripts'),
+                        "cost": current_video_cost,
+                        "duration": duration_seconds,
+                        "timer": timer
+                    })
 
-                    transcribe_cuts.transcribe(input_folder='tmp', output_folder='subs')
-                    
-                    adjust_subtitles.adjust(
-                        current_style_config['base_color'], 
-                        current_style_config['base_size'], 
-                        current_style_config['h_size'], 
-                        current_style_config['highlight_color'], 
-                        current_style_config['palavras_por_bloco'], 
-                        current_style_config['limite_gap'], 
-                        current_style_config['modo'], 
-                        current_style_config['posicao_vertical'], 
-                        current_style_config['alinhamento'], 
-                        current_style_config['fonte'], 
-                        current_style_config['contorno'], 
-                        current_style_config['cor_da_sombra'], 
-                        current_style_config['negrito'], 
-                        current_style_config['italico'],
-                        current_style_config['sublinhado'],
-                        current_style_config['tachado'],
-                        current_style_config['estilo_da_borda'],
-                        current_style_config['espessura_do_contorno'],
-                        current_style_config['tamanho_da_sombra']
+                except Exception as inner_e:
+                    print(f"Error processing video {vid_url}: {inner_e}")
+                    continue
+
+            # Transcribe and align every input once, pooling their chunks into shared batches.
+            batch_timer = StageTimer("subtitles:batch")
+            try:
+                with batch_timer.stage("transcribe_align"):
+                    generate_whisperx_batch(
+                        [job["input"] for job in prepared], 'transcripts',
+                        cache_prefixes=[job["cache_prefix"] for job in prepared],
+                        model_name=stage_model_name('subtitles'),
+                        durations=[job["duration"] for job in prepared]
                     )
+            except Exception as batch_e:
+                print(f"Batched transcription failed, falling back to per-file: {batch_e}")
+                for job in prepared:
+                    try:
+                        with job["timer"].stage("transcribe_align"):
+                            generate_whisperx(job["input"], 'transcripts', cache_prefix=job["cache_prefix"], model_name=stage_model_name('subtitles'))
+                    except Exception as file_e:
+                        print(f"Error transcribing video {job['url']}: {file_e}")
+            batch_timer.report()
+
+            for job in prepared:
+                vid_url = job["url"]
+                timer = job["timer"]
+                current_video_cost = job["cost"]
+
+                for folder in required_folders:
+                    if os.path.exists(folder):
+                        shutil.rmtree(folder)
+                    os.makedirs(folder, exist_ok=True)
+
+                try:
+                    transcript_path, _ = output_paths(job["input"], 'transcripts')
+                    if not os.path.exists(transcript_path):
+                        print(f"No transcript produced for {vid_url}")
+                        continue
+
+                    shutil.copy2(job["input"], "tmp/output000_original_scale.mp4")
+                    shutil.copy2(transcript_path, "subs/output000_original_scale.json")
+                    
+                    with timer.stage("ass_generation"):
+                        adjust_subtitles.adjust(
+                            current_style_config['base_color'], 
+                            current_style_config['base_size'], 
+                            current_style_config['h_size'], 
+                            current_style_config['highlight_color'], 
+                            current_style_config['palavras_por_bloco'], 
+                            current_style_config['limite_gap'], 
+                            current_style_config['modo'], 
+                            current_style_config['posicao_vertical'], 
+                            current_style_config['alinhamento'], 
+                            current_style_config['fonte'], 
+                            current_style_config['contorno'], 
+                            current_style_config['cor_da_sombra'], 
+                            current_style_config['negrito'], 
+                            current_style_config['italico'],
+                            current_style_config['sublinhado'],
+                            current_style_config['tachado'],
+                            current_style_config['estilo_da_borda'],
+                            current_style_config['espessura_do_contorno'],
+                            current_style_config['tamanho_da_sombra']
+                        )
                     
                     segments=[{"title": ""}]
                     
-                    burn_subtitles.burn_with_title_and_channel(
-                        optional_header="", 
-                        segments=segments, 
-                        font_size=100, 
-                        channel_name=watermark_text,
-                        aspect_ratio=aspect_ratio,
-                    )
+                    with timer.stage("burn"):
+                        burn_subtitles.burn_with_title_and_channel(
+                            optional_header="", 
+                            segments=segments, 
+                            font_size=100, 
+                            channel_name=watermark_text,
+                            aspect_ratio=aspect_ratio,
+                        )
 
                     generated_count_for_url = 0
                     fpath = f"burned_sub/final-output{str(0).zfill(3)}_processed.mp4"
@@ -676,6 +819,8 @@ def createSubtitlesJob(request):
                 except Exception as inner_e:
                     print(f"Error processing video {vid_url}: {inner_e}")
                     continue
+                finally:
+                    timer.report()
 
         status = "completed" if successful_videos == len(urls) else "completed" if successful_videos > 0 else "failed"
         status_msg = None
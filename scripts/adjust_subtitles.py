@@ -2,7 +2,7 @@ import json
 import re
 import os
 
-def adjust(base_color, base_size, h_size, highlight_color, palavras_por_bloco, limite_gap, modo, posicao_vertical, alinhamento, fonte, contorno, cor_da_sombra,negrito,italico, sublinhado, tachado, estilo_da_borda,espessura_do_contorno, tamanho_da_sombra):
+def adjust(base_color, base_size, h_size, highlight_color, palavras_por_bloco, limite_gap, modo, posicao_vertical, alinhamento, fonte, contorno, cor_da_sombra,negrito,italico, sublinhado, tachado, estilo_da_borda,espessura_do_contorno, tamanho_da_sombra, filenames=None):
     def gerar_ass(json_data, arquivo_saida, base_color=base_color, base_size=base_size, h_size=h_size, highlight_color=highlight_color, palavras_por_bloco=palavras_por_bloco, limite_gap=limite_gap, modo=modo, posicao_vertical=posicao_vertical, alinhamento=alinhamento, fonte=fonte, contorno=contorno, cor_da_sombra=cor_da_sombra, negrito=negrito, italico=italico, sublinhado=sublinhado, tachado=tachado, estilo_da_borda=estilo_da_borda, espessura_do_contorno=espessura_do_contorno, tamanho_da_sombra=tamanho_da_sombra):
         header_ass = f"""[Script Info]
     Title: Legendas Dinâmicas
@@ -105,8 +105,8 @@ def adjust(base_color, base_size, h_size, highlight_color, palavras_por_bloco, l
     # Criar o diretório de saída se não existir
     os.makedirs(output_dir, exist_ok=True)
 
-    # Processar todos os arquivos JSON na pasta de entrada
-    for filename in os.listdir(input_dir):
+    # Processar todos os arquivos JSON na pasta de entrada (ou apenas os indicados)
+    for filename in (filenames if filenames is not None else os.listdir(input_dir)):
         if filename.endswith(".json"):
             input_path = os.path.join(input_dir, filename)
             output_filename = os.path.splitext(filename)[0] + ".ass"
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import numpy as np
+
+# whisperx.audio.SAMPLE_RATE, kept local so segment selection does not need
+# whisperx (and torch) installed.
+SAMPLE_RATE = 16000
+
+
+def extracted_path(input_file):
+    return os.path.splitext(input_file)[0] + ".f32"
+
+
+def extract_audio(input_file, output_path=None, sr=SAMPLE_RATE):
+    """
+    Decodes the input once into raw mono float32 PCM at 16 kHz in the job
+    workspace. Later calls for the same input reuse the file.
+    """
+    output_path = output_path or extracted_path(input_file)
+    if os.path.exists(output_path):
+        return output_path
+
+    partial_path = output_path + ".partial"
+    cmd = [
+        "ffmpeg", "-nostdin", "-y",
+        "-threads", "0",
+        "-i", input_file,
+        "-f", "f32le",
+        "-ac", "1",
+        "-acodec", "pcm_f32le",
+        "-ar", str(sr),
+        partial_path
+    ]
+    subprocess.run(cmd, capture_output=True, check=True)
+    os.replace(partial_path, output_path)
+    print(f"Extracted audio of {input_file} to {output_path}")
+    return output_path
+
+
+def remove_extracted(input_file):
+    """Deletes the extracted PCM of input_file, if any, to free the workspace."""
+    try:
+        os.remove(extracted_path(input_file))
+    except FileNotFoundError:
+        pass
+
+
+def open_audio(path):
+    """
+    Memory-maps an extracted PCM file read-only. Slices of the returned array
+    are views, so consumers share the page cache instead of holding copies.
+    """
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode='r')
+
+
+def load_shared_audio(input_file):
+    return open_audio(extract_audio(input_file))
+
+
+def audio_slice(audio, start_seconds, end_seconds, sr=SAMPLE_RATE):
+    start = max(0, int(start_seconds * sr))
+    end = min(len(audio), int(end_seconds * sr))
+    return audio[start:max(start, end)]
@@ -0,0 +1,128 @@
+import time
+from collections import OrderedDict
+from faster_whisper.tokenizer import Tokenizer
+from whisperx.audio import SAMPLE_RATE
+from whisperx.vads import Vad, Pyannote
+
+
+def log_throughput(label, audio_seconds, wall_seconds):
+    rate = audio_seconds / wall_seconds if wall_seconds > 0 else 0.0
+    print(
+        f"[asr_throughput:{label}] {audio_seconds:.1f}s of audio in {wall_seconds:.2f}s "
+        f"({rate:.2f} audio-s/wall-s)"
+    )
+    return rate
+
+
+def vad_chunks(model, audio, chunk_size=30):
+    """
+    Runs the pipeline's VAD over one audio array and merges the speech
+    regions into chunks of at most chunk_size seconds, exactly as
+    FasterWhisperPipeline.transcribe does before decoding.
+    """
+    if issubclass(type(model.vad_model), Vad):
+        waveform = model.vad_model.preprocess_audio(audio)
+        merge_chunks = model.vad_model.merge_chunks
+    else:
+        waveform = Pyannote.preprocess_audio(audio)
+        merge_chunks = Pyannote.merge_chunks
+
+    vad_segments = model.vad_model({"waveform": waveform, "sample_rate": SAMPLE_RATE})
+    return merge_chunks(
+        vad_segments,
+        chunk_size,
+        onset=model._vad_params["vad_onset"],
+        offset=model._vad_params["vad_offset"],
+    )
+
+
+# The helpers below set model.tokenizer on the pipeline they are given, so
+# the caller must hold it exclusively (whisper_gen.transcription_model does).
+def _set_language(model, language):
+    model.tokenizer = Tokenizer(
+        model.model.hf_tokenizer,
+        model.model.model.is_multilingual,
+        task="transcribe",
+        language=language,
+    )
+
+
+def decode_chunks(model, items, batch_size):
+    """
+    Decodes (audio, chunk) pairs that share the currently configured
+    tokenizer language. Yields (index, text) in input order.
+    """
+    def data():
+        for audio, chunk in items:
+            f1 = int(chunk['start'] * SAMPLE_RATE)
+            f2 = int(chunk['end'] * SAMPLE_RATE)
+            yield {'inputs': audio[f1:f2]}
+
+    for idx, out in enumerate(model(data(), batch_size=batch_size, num_workers=0)):
+        text = out['text']
+        if batch_size in [0, 1, None]:
+            text = text[0]
+        yield idx, text
+
+
+def transcribe_chunks(model, audio, chunks, language, batch_size=4):
+    """
+    Decodes pre-computed VAD chunks of a single audio array in the given
+    language. Returns segments shaped like FasterWhisperPipeline.transcribe.
+    """
+    segments = []
+    try:
+        _set_language(model, language)
+        for idx, text in decode_chunks(model, [(audio, chunk) for chunk in chunks], batch_size):
+            segments.append({
+                "text": text,
+                "start": round(chunks[idx]['start'], 3),
+                "end": round(chunks[idx]['end'], 3),
+            })
+    finally:
+        if model.preset_language is None:
+            model.tokenizer = None
+    return segments
+
+
+def transcribe_batch(model, audios, batch_size=16, language=None):
+    """
+    Transcribes several audio arrays with one whisperx pipeline, pooling the
+    VAD chunks of every file into shared decoder batches instead of running
+    each short file with a mostly empty batch. Files are grouped by detected
+    language because the decoder prompt is per language.
+
+    Returns one {"segments", "language"} dict per input, in input order.
+    """
+    started = time.perf_counter()
+    results = []
+    by_language = OrderedDict()
+
+    for file_idx, audio in enumerate(audios):
+        chunks = vad_chunks(model, audio)
+        file_language = language or model.preset_language or model.detect_language(audio)
+        results.append({"segments": [], "language": file_language})
+        for chunk in chunks:
+            by_language.setdefault(file_language, []).append((file_idx, audio, chunk))
+
+    try:
+        for group_language, entries in by_language.items():
+            _set_language(model, group_language)
+            items = [(audio, chunk) for _, audio, chunk in entries]
+            for idx, text in decode_chunks(model, items, batch_size):
+                file_idx, _, chunk = entries[idx]
+                results[file_idx]["segments"].append({
+                    "text": text,
+                    "start": round(chunk['start'], 3),
+                    "end": round(chunk['end'], 3),
+                })
+    finally:
+        # Same reset transcribe() performs when no language was preset.
+        if model.preset_language is None:
+            model.tokenizer = None
+
+    audio_seconds = sum(len(audio) for audio in audios) / SAMPLE_RATE
+    chunk_count = sum(len(entries) for entries in by_language.values())
+    print(f"[batched_asr] {len(audios)} files, {chunk_count} chunks, batch_size={batch_size}")
+    log_throughput("batched", audio_seconds, time.perf_counter() - started)
+    return results
@@ -1,77 +1,421 @@
 import json
 import os
 import time
-import random
-import re
-from google import genai
+import math
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from google.genai.errors import APIError
+from scripts.tiered_cache import TieredCache
+from scripts import transcript_format
+from scripts import prerank
+from scripts import transcript_search
+from scripts import select_segments
+from scripts import time_index
+from scripts.llm_backends import GEMINI_MODEL, as_backend, HeuristicBackend
+from scripts.rate_limiter import gemini_limiter, is_quota_error, retry_delay
+from scripts.hedging import CircuitOpenError, stage_policy, gemini_breaker, hedging_stats
+from scripts.segment_schema import (
+    ViralSegment,
+    ViralSegmentsDocument,
+    SegmentCandidate,
+    CandidatesDocument,
+    RankingDocument,
+    ParsedDocument,
+    parse_document,
+    parse_segment_list,
+    parse_ranking,
+    SegmentStreamParser,
+)
 
-def ask_gemini_flash_2_5(client, prompt: str, retries=3) -> str:
+RESPONSE_CACHE_VERSION = 2
+
+_response_cache = TieredCache(
+    name="gemini_responses",
+    local_dir=os.getenv('GEMINI_CACHE_DIR', '/tmp/shorts-cache'),
+    version=RESPONSE_CACHE_VERSION,
+    max_age_seconds=float(os.getenv('GEMINI_CACHE_TTL', str(7 * 24 * 3600))),
+    max_local_mb=float(os.getenv('GEMINI_CACHE_LOCAL_MB', '64')),
+)
+
+def ask_gemini_flash_2_5(client, prompt: str, retries=3, response_schema=None, stage="selection") -> str:
     """
     Sends a prompt to the gemini-2.5-flash cloud model with retry logic.
+    With a response_schema the model is constrained to JSON matching it.
+    client is a genai client or any backend from scripts.llm_backends.
+    Remote calls follow the deadline and hedging policy of their stage and
+    return "" without calling out while the Gemini circuit breaker is open.
     """
     print("ask_gemini_flash_2_5")
-    if client is None:
+    backend = as_backend(client)
+    if backend is None:
         print("Error: Client is None")
         return ""
 
+    if not backend.remote:
+        try:
+            return backend.generate(prompt, response_schema)
+        except Exception as e:
+            print(f"Unexpected error: {e}")
+            return ""
+
+    breaker = gemini_breaker()
+    if not breaker.allow():
+        print("Gemini circuit breaker is open, skipping the call")
+        return ""
+
+    policy = stage_policy(stage)
     for attempt in range(retries):
         try:
-            response = client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=[
-                    {
-                        'role': 'user',
-                        'parts': [{'text': prompt}],
-                    },
-                ],
-            )
-            return response.text
+            text = policy.call(lambda: backend.generate(prompt, response_schema, policy.deadline_seconds))
+            breaker.record_success()
+            return text
+        except TimeoutError as e:
+            print(f"Gemini deadline exceeded (Attempt {attempt+1}/{retries}): {e}")
+            breaker.record_failure()
+            if attempt == retries - 1 or not breaker.allow():
+                return ""
         except APIError as e:
             print(f"Gemini API Error (Attempt {attempt+1}/{retries}): {e}")
+            breaker.record_failure()
             if attempt < retries - 1:
-                time.sleep(2 ** attempt + random.uniform(0, 1))
+                delay = retry_delay(e, attempt)
+                if is_quota_error(e):
+                    # Hold back every caller in this process, not just this one.
+                    gemini_limiter().throttle(delay)
+                else:
+                    time.sleep(delay)
             else:
                 print(f"Failed after {retries} attempts.")
                 return ""
         except Exception as e:
             print(f"Unexpected error: {e}")
+            breaker.record_failure()
             return ""
     return ""
 
-def extract_json(text):
+def stream_gemini_flash_2_5(client, prompt: str, response_schema=None):
+    """
+    Yields the response text of gemini-2.5-flash piece by piece as it is
+    generated. Errors are raised to the caller, which decides how to recover.
+    """
+    print("stream_gemini_flash_2_5")
+    backend = as_backend(client)
+    if backend.remote and not gemini_breaker().allow():
+        raise CircuitOpenError("Gemini circuit breaker is open")
+    yield from backend.stream(prompt, response_schema, stage_policy("stream").deadline_seconds)
+
+def _backend_name(client):
+    backend = as_backend(client)
+    return backend.name if backend is not None else GEMINI_MODEL
+
+def response_cache_key(prompt, model=GEMINI_MODEL):
+    """
+    The prompt embeds the chunk text, segment count, min/max duration and
+    custom instructions, so hashing it with the model id covers every input
+    that can change the response.
+    """
+    return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+def repair_document(client, parsed, document_model=ViralSegmentsDocument, segment_model=ViralSegment):
+    """
+    Makes at most one small extra call to fix what failed validation. Only the
+    malformed segment objects are sent back when the document itself parsed,
+    and the raw response (never the transcript) when it did not.
+    """
+    if parsed.unparseable is not None:
+        if not parsed.unparseable.strip():
+            return parsed
+        prompt = (
+            "The text below was meant to be a JSON document with 'tags' and 'segments' but it is malformed. "
+            "Return the same content as valid JSON. Do not add or invent segments.\n\n"
+            f"{parsed.unparseable}"
+        )
+        return parse_document(ask_gemini_flash_2_5(client, prompt, retries=1, response_schema=document_model, stage="repair"), segment_model)
+
+    if parsed.malformed:
+        prompt = (
+            "These segment objects do not match the required schema: title (string), start_time and end_time "
+            "(milliseconds), score (0-100) and duration (seconds). Return them corrected as a JSON list, "
+            "dropping any that cannot be fixed.\n\n"
+            f"{json.dumps(parsed.malformed, ensure_ascii=False)}"
+        )
+        fixed = parse_segment_list(ask_gemini_flash_2_5(client, prompt, retries=1, response_schema=list[segment_model], stage="repair"), segment_model)
+        return ParsedDocument(tags=parsed.tags, segments=parsed.segments + fixed)
+
+    return parsed
+
+def heuristic_document(prompt, segment_model=ViralSegment):
+    """
+    Local stand-in answer used while Gemini is degraded. It is never cached,
+    so the chunk is asked again once the API recovers.
+    """
+    print("Using the heuristic selector for this chunk")
+    return parse_document(HeuristicBackend().generate(prompt), segment_model).to_dict()
+
+def analyze_chunk(client, prompt, cache_prefix=None, document_model=ViralSegmentsDocument, segment_model=ViralSegment):
+    """
+    Returns the validated {"tags", "segments"} document for one chunk prompt,
+    from the response cache when an identical prompt was answered before.
+    Returns None when the chunk produced nothing usable.
+    """
+    use_cache = os.getenv('GEMINI_CACHE_ENABLED', 'true').lower() == 'true'
+    key = response_cache_key(prompt, _backend_name(client))
+    if use_cache:
+        cached = _response_cache.get(key, bucket_prefix=cache_prefix)
+        if cached is not None:
+            return cached
+
+    response_text = ask_gemini_flash_2_5(client, prompt, response_schema=document_model)
+    print(f"Gemini Response Length: {len(response_text)}")
+    if not response_text:
+        return heuristic_document(prompt, segment_model) if gemini_breaker().is_open else None
+
+    parsed = parse_document(response_text, segment_model)
+    if not parsed.complete:
+        print(f"Response failed validation ({len(parsed.malformed)} malformed segments), repairing...")
+        parsed = repair_document(client, parsed, document_model, segment_model)
+    if parsed.unparseable is not None:
+        return None
+
+    document = parsed.to_dict()
+    if use_cache:
+        _response_cache.put(key, document, bucket_prefix=cache_prefix)
+    return document
+
+def _segment_id(segment):
+    return (segment["start_time"], segment["end_time"], segment["title"])
+
+def stream_chunk(client, prompt, on_segment, cache_prefix=None):
     """
-    Robustly extracts JSON object from a string using regex, 
-    handling potential markdown text or extra whitespace.
+    Streams one chunk prompt and hands every validated segment to on_segment
+    as soon as its JSON object is complete. Returns the same document as
+    analyze_chunk. Cached documents are replayed at once, and a stream that
+    breaks part-way falls back to analyze_chunk without repeating segments.
     """
-    if not text:
+    use_cache = os.getenv('GEMINI_CACHE_ENABLED', 'true').lower() == 'true'
+    key = response_cache_key(prompt, _backend_name(client))
+    if use_cache:
+        cached = _response_cache.get(key, bucket_prefix=cache_prefix)
+        if cached is not None:
+            for segment in cached["segments"]:
+                on_segment(segment)
+            return cached
+
+    if client is None:
+        print("Error: Client is None")
         return None
+
+    parser = SegmentStreamParser()
+    emitted = set()
+
+    def emit(segments):
+        for segment in segments:
+            if _segment_id(segment) not in emitted:
+                emitted.add(_segment_id(segment))
+                on_segment(segment)
+
+    remote = as_backend(client).remote
     try:
-        # Find the first opening brace and the last closing brace
-        match = re.search(r'\{.*\}', text, re.DOTALL)
-        if match:
-            json_str = match.group(0)
-            return json.loads(json_str)
-        # Fallback: try parsing the whole text
-        return json.loads(text)
-    except json.JSONDecodeError:
-        print("Failed to decode JSON from response.")
+        for text in stream_gemini_flash_2_5(client, prompt, response_schema=ViralSegmentsDocument):
+            emit([segment.model_dump() for segment in parser.feed(text)])
+        if remote:
+            gemini_breaker().record_success()
+    except Exception as e:
+        print(f"Gemini stream failed, retrying without streaming: {e}")
+        if is_quota_error(e):
+            gemini_limiter().throttle(retry_delay(e, 0))
+        if remote and not isinstance(e, CircuitOpenError):
+            # The breaker let this stream through, so its failure must be
+            # recorded even during a half-open trial.
+            gemini_breaker().record_failure()
+        document = analyze_chunk(client, prompt, cache_prefix)
+        if document:
+            emit(document["segments"])
+        return document
+
+    print(f"Gemini Response Length: {len(parser.text)}")
+    parsed = parse_document(parser.text)
+    if not parsed.complete:
+        print(f"Response failed validation ({len(parsed.malformed)} malformed segments), repairing...")
+        parsed = repair_document(client, parsed)
+    if parsed.unparseable is not None:
+        return None
+
+    document = parsed.to_dict()
+    emit(document["segments"])
+    if use_cache:
+        _response_cache.put(key, document, bucket_prefix=cache_prefix)
+    return document
+
+def spread_order(n):
+    """
+    Chunk indices in an order whose every prefix is spread across the whole
+    video (0, n/2, n/4, 3n/4, ...), so stopping early still samples all of it.
+    """
+    def radical_inverse(i):
+        result, fraction = 0.0, 0.5
+        while i:
+            result += fraction * (i & 1)
+            i >>= 1
+            fraction /= 2
+        return result
+
+    order = []
+    seen = set()
+    i = 0
+    while len(order) < n:
+        index = int(radical_inverse(i) * n)
+        if index not in seen:
+            seen.add(index)
+            order.append(index)
+        i += 1
+    return order
+
+def early_stop_policy(num_segments):
+    """
+    Returns a stop condition for ask_gemini_for_chunks when SEGMENT_EARLY_STOP
+    is on: stop once SEGMENT_EARLY_STOP_MIN_COUNT segments (default: the
+    requested clip count) scoring at least SEGMENT_EARLY_STOP_MIN_SCORE have
+    been found. Returns None when early stopping is off.
+    """
+    if os.getenv('SEGMENT_EARLY_STOP', 'false').lower() != 'true':
+        return None
+    min_count = int(os.getenv('SEGMENT_EARLY_STOP_MIN_COUNT', str(num_segments)))
+    min_score = float(os.getenv('SEGMENT_EARLY_STOP_MIN_SCORE', '80'))
+
+    def enough(documents):
+        strong = [
+            segment for document in documents
+            for segment in document.get("segments", [])
+            if float(segment.get("score", 0)) >= min_score
+        ]
+        return len(select_segments.deduplicate(strong)) >= min_count
+    return enough
+
+def ask_gemini_for_chunks(client, prompts, max_concurrency=None, cache_prefix=None, document_model=ViralSegmentsDocument, segment_model=ViralSegment, stop_when=None):
+    """
+    Analyzes the chunk prompts with at most max_concurrency requests in
+    flight, each with the usual retry and backoff. Documents keep the prompt
+    order. With stop_when, chunks are visited in spread_order and no new
+    chunk is started once stop_when(documents so far) is true; skipped
+    chunks are returned as None.
+    """
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv('GEMINI_MAX_CONCURRENCY', '4'))
+    max_concurrency = max(1, min(max_concurrency, len(prompts)))
+
+    def analyze(prompt):
+        return analyze_chunk(client, prompt, cache_prefix, document_model, segment_model)
+
+    documents = [None] * len(prompts)
+    queue = iter(spread_order(len(prompts)) if stop_when else range(len(prompts)))
+    stopped = False
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        pending = {}
+
+        def submit_next():
+            index = next(queue, None)
+            if index is not None:
+                pending[executor.submit(analyze, prompts[index])] = index
+
+        for _ in range(max_concurrency):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                documents[pending.pop(future)] = future.result()
+            if not stopped and stop_when is not None and stop_when([d for d in documents if d]):
+                stopped = True
+            if not stopped:
+                for _ in done:
+                    submit_next()
+
+    if stopped:
+        skipped = sum(1 for d in documents if d is None)
+        print(f"Early stop: enough strong segments found, skipped {skipped} of {len(prompts)} chunks")
+
+    print(f"[rate_limiter:gemini] {gemini_limiter().stats()}")
+    print(f"[hedge] {hedging_stats()}")
+    return documents
+
+def chunk_transcript(content, chunk_size=120000):
+    """Splits the transcript text into chunks of at most chunk_size characters at line breaks."""
+    chunks = []
+    start = 0
+    if len(content) > chunk_size:
+        while start < len(content):
+            end = content.rfind('\n', start, start + chunk_size)
+            if end == -1 or end <= start:
+                end = start + chunk_size
+            chunks.append(content[start:min(end, len(content))])
+            start = end + 1
+    else:
+        chunks.append(content)
+    return chunks
+
+def map_candidates_per_chunk(total_chunks, num_segments):
+    """
+    Number of candidates the map step asks of each chunk, or None when the
+    transcript is short enough to be analyzed chunk by chunk as before.
+    Asking for about three candidates per requested clip in total keeps the
+    reduce prompt small however long the video is.
+    """
+    if os.getenv('SEGMENT_MAP_REDUCE', 'true').lower() != 'true':
+        return None
+    if total_chunks < int(os.getenv('SEGMENT_MAP_REDUCE_MIN_CHUNKS', '3')):
         return None
+    max_per_chunk = int(os.getenv('SEGMENT_MAP_CANDIDATES', '3'))
+    return max(1, min(max_per_chunk, math.ceil(3 * int(num_segments) / total_chunks)))
 
-def create_viral_segments(num_segments, instructions, tempo_minimo, tempo_maximo, client):
+def build_chunk_prompts(num_segments, instructions, tempo_minimo, tempo_maximo, client, allow_map_reduce=False):
     """
     Analyzes a video transcript to generate prompts for an AI to identify potential viral segments.
+    With allow_map_reduce, long transcripts get map prompts instead, asking
+    each chunk for a few summarized candidates. Returns None when there is
+    no transcript.
     """
-    output_txt_file = "tmp/viral_segments.txt"
-    if os.path.exists(output_txt_file):
-        return read_json_file(output_txt_file)
-    
     try:
         with open('tmp/input_video.tsv', 'r', encoding='utf-8') as f:
             content = f.read()
     except FileNotFoundError:
         print("Error: 'tmp/input_video.tsv' not found.")
-        return {"segments": [], "tags": []}
+        return None
+
+    spans = None
+    targeted = False
+    if instructions and os.getenv('TARGETED_SEARCH_ENABLED', 'true').lower() == 'true':
+        # Custom instructions name the content they want, so the passages
+        # that match them replace the feature-based pre-ranking.
+        spans = transcript_search.relevant_spans(
+            instructions, transcript_format.load_transcript_lines(), num_segments, tempo_maximo
+        )
+        targeted = spans is not None
+    if spans is None and os.getenv('PRERANK_ENABLED', 'true').lower() == 'true':
+        spans = prerank.candidate_spans(num_segments, tempo_maximo)
+
+    time_unit = "seconds"
+    if os.getenv('TRANSCRIPT_COMPACT', 'true').lower() == 'true':
+        resolution_ms = int(os.getenv('TRANSCRIPT_TIME_RESOLUTION_MS', '1000'))
+        lines = transcript_format.load_transcript_lines()
+        if spans:
+            lines = prerank.filter_lines(lines, spans)
+        compact = transcript_format.compact_transcript(lines, resolution_ms=resolution_ms)
+        # Exact counts need the live genai client; other backends use the estimate.
+        token_client = getattr(as_backend(client), 'client', None) if os.getenv('GEMINI_COUNT_TOKENS', 'false').lower() == 'true' else None
+        before = transcript_format.count_tokens(token_client, content, GEMINI_MODEL)
+        after = transcript_format.count_tokens(token_client, compact, GEMINI_MODEL)
+        print(f"Transcript prompt tokens: {before} raw TSV -> {after} compact ({len(content)} -> {len(compact)} chars)")
+        content = compact
+        time_unit = transcript_format.time_unit_description(resolution_ms)
+    elif spans:
+        lines = prerank.filter_lines(transcript_format.load_transcript_lines(), spans)
+        content = "\n".join(["start\tend\ttext"] + [f"{start}\t{end}\t{text}" for start, end, text in lines])
+
+    excerpt_note = ""
+    if targeted:
+        excerpt_note = " The transcript only contains the passages that match the special instructions, so gaps between timestamps are expected."
+    elif spans:
+        excerpt_note = " The transcript only contains pre-selected candidate passages, so gaps between timestamps are expected."
 
     system_prompt = (
         "You are a Viral Segment Identifier professional that analyzes a video's transcript and predicts which segments "
@@ -98,20 +442,20 @@ def create_viral_segments(num_segments, instructions, tempo_minimo, tempo_maximo
     ]
 }
 '''
-    chunk_size = 120000
-    chunks = []
-    start = 0
-    if len(content) > chunk_size:
-        while start < len(content):
-            end = content.rfind('\n', start, start + chunk_size)
-            if end == -1 or end <= start:
-                end = start + chunk_size
-            chunks.append(content[start:min(end, len(content))])
-            start = end + 1
-    else:
-        chunks.append(content)
+    chunks = chunk_transcript(content)
 
     analysis_type = f"identify at least {num_segments} distinct text segments that are either viral or potentially viral, focusing on the most engaging content"
+    chunk_segments = num_segments
+    candidate_rule = ""
+    candidates = map_candidates_per_chunk(len(chunks), num_segments) if allow_map_reduce else None
+    if candidates:
+        chunk_segments = candidates
+        analysis_type = f"identify the {candidates} strongest candidate segments in this part of the video; they will be ranked against candidates from the other parts"
+        candidate_rule = f"\n2b. Return no more than {candidates} segments, and give each a one-sentence 'summary' of what happens in it."
+        json_template = json_template.replace(
+            '"duration": 10',
+            '"duration": 10,\n            "summary": "One sentence describing what happens"'
+        )
 
     output_prompts = []
     total_chunks = len(chunks)
@@ -126,10 +470,11 @@ def create_viral_segments(num_segments, instructions, tempo_minimo, tempo_maximo
 {system_prompt}{chunk_context_info}
 
 ## INSTRUCTIONS
-1.  Carefully read the provided video transcript below, which includes start and end times in milliseconds for each line.
+1.  Carefully read the provided video transcript below. Each line starts with its start and end time in {time_unit}, followed by the spoken text.{excerpt_note}
+1a. The start_time and end_time in your output MUST be in milliseconds.
 2.  Your task is to {analysis_type}.
 2a. You **MUST** ignore each episode intro song and do not include it in the segments.
-2a. You **MUST** return a list of segments that totals at least **{num_segments}** segments.
+2a. You **MUST** return a list of segments that totals at least **{chunk_segments}** segments.{candidate_rule}
 3.  Each identified segment MUST have a minimum duration of {tempo_minimo} and maximum of {tempo_maximo} seconds.
 4.  Segments MUST not overlap.
 6.  The cuts **MUST** make logical sense and should not end abruptly.
@@ -145,15 +490,97 @@ Based on your analysis, provide your response in the following JSON format:
 """
         output_prompts.append(prompt)
 
+    return output_prompts
+
+def _video_end_ms():
+    transcript_lines = transcript_format.load_transcript_lines()
+    return max(end for _, end, _ in transcript_lines) * 1000 if transcript_lines else None
+
+def _merge_tags(documents):
+    tags = []
+    for json_data in documents:
+        if json_data and json_data.get("tags"):
+            tags = json_data["tags"]
+    return tags
+
+def build_ranking_prompt(candidates, num_segments, instructions):
+    lines = [
+        f"{i} | {c['start_time'] / 1000:.0f}-{c['end_time'] / 1000:.0f} | {c.get('score', 0):.0f} | {c.get('title', '')} | {c.get('summary', '')}"
+        for i, c in enumerate(candidates)
+    ]
+    candidate_list = "\n".join(lines)
+    return f"""
+You are a Viral Segment Identifier professional choosing the final clips of a long video from candidate segments found in each part of it.
+Special Instructions MUST FOLLOW ALWAYS: {instructions}
+
+## INSTRUCTIONS
+1.  Each line below is one candidate: number | start-end in seconds | score from its own part | title | summary.
+2.  Rank the candidates against each other for viral potential across the whole video.
+3.  Return the best {num_segments} candidates as picks, best first, each with its candidate number and a score from 0 to 100 that is comparable across the whole video.
+4.  Picks MUST not overlap in time.
+5.  Your final output must be ONLY the JSON structure below. Do not add explanations.
+
+## CANDIDATES
+{candidate_list}
+
+## JSON OUTPUT FORMAT
+{{"picks": [{{"candidate": 0, "score": 95}}]}}
+"""
+
+def rank_candidates(client, candidates, num_segments, instructions, cache_prefix=None):
+    """
+    Reduce step: one small call ranks every map candidate globally. Returns
+    the picked candidates with their global scores, or None when the ranking
+    could not be obtained.
+    """
+    prompt = build_ranking_prompt(candidates, num_segments, instructions)
+    use_cache = os.getenv('GEMINI_CACHE_ENABLED', 'true').lower() == 'true'
+    key = response_cache_key(prompt, _backend_name(client))
+    ranking = _response_cache.get(key, bucket_prefix=cache_prefix) if use_cache else None
+
+    if ranking is None:
+        parsed = parse_ranking(ask_gemini_flash_2_5(client, prompt, response_schema=RankingDocument, stage="reduce"))
+        if parsed is None:
+            return None
+        ranking = parsed.model_dump()
+        if use_cache:
+            _response_cache.put(key, ranking, bucket_prefix=cache_prefix)
+
+    picked = []
+    seen = set()
+    for pick in ranking["picks"]:
+        index = pick["candidate"]
+        if 0 <= index < len(candidates) and index not in seen:
+            seen.add(index)
+            picked.append({**candidates[index], "score": pick["score"]})
+    return picked
+
+def create_viral_segments(num_segments, instructions, tempo_minimo, tempo_maximo, client, generate_title=False, max_concurrency=None, cache_prefix=None):
+    """
+    Asks Gemini for viral segments in every transcript chunk and keeps the
+    best num_segments of them.
+    """
+    output_txt_file = "tmp/viral_segments.txt"
+    if os.path.exists(output_txt_file):
+        return read_json_file(output_txt_file)
+
+    output_prompts = build_chunk_prompts(num_segments, instructions, tempo_minimo, tempo_maximo, client, allow_map_reduce=True)
+    if output_prompts is None:
+        return {"segments": [], "tags": []}
+
+    if map_candidates_per_chunk(len(output_prompts), num_segments):
+        return _create_viral_segments_map_reduce(
+            output_prompts, num_segments, instructions, tempo_minimo, tempo_maximo, client, max_concurrency, cache_prefix
+        )
+
     viral_segments = []
     tags = []
 
-    for viral_segment_prompt in output_prompts:
-        response_text = ask_gemini_flash_2_5(client, viral_segment_prompt)
-        print(f"Gemini Response Length: {len(response_text)}")
-        
-        json_data = extract_json(response_text)
-        
+    documents = ask_gemini_for_chunks(
+        client, output_prompts, max_concurrency, cache_prefix, stop_when=early_stop_policy(num_segments)
+    )
+
+    for json_data in documents:
         if json_data:
             current_tags = json_data.get("tags", [])
             if current_tags:
@@ -164,6 +591,11 @@ Based on your analysis, provide your response in the following JSON format:
         else:
              print("Skipping chunk due to JSON parsing failure.")
 
+    viral_segments = select_segments.select_top_segments(
+        viral_segments, num_segments, tempo_minimo, tempo_maximo, video_end_ms=_video_end_ms()
+    )
+    viral_segments = time_index.snap_segments(viral_segments, tempo_minimo, tempo_maximo)
+
     result_data = {
         "segments": viral_segments,
         "tags": tags
@@ -172,6 +604,91 @@ Based on your analysis, provide your response in the following JSON format:
     save_viral_segments(result_data)
     return result_data
 
+def _create_viral_segments_map_reduce(map_prompts, num_segments, instructions, tempo_minimo, tempo_maximo, client, max_concurrency=None, cache_prefix=None):
+    """
+    Map: every chunk proposes a few summarized candidates. Reduce: one small
+    prompt ranks all candidates globally. Calls grow by one per chunk plus
+    one, and the reduce prompt only by a few lines per chunk. If the ranking
+    fails, or returns too few usable picks, the map scores fill the gap.
+    """
+    print(f"Map-reduce selection over {len(map_prompts)} chunks")
+    documents = ask_gemini_for_chunks(
+        client, map_prompts, max_concurrency, cache_prefix,
+        document_model=CandidatesDocument, segment_model=SegmentCandidate,
+        stop_when=early_stop_policy(num_segments)
+    )
+    candidates = [segment for document in documents if document for segment in document.get("segments", [])]
+    video_end_ms = _video_end_ms()
+
+    picked = rank_candidates(client, candidates, num_segments, instructions, cache_prefix) if candidates else None
+    if picked is None:
+        print("Ranking step failed, keeping the best candidates by their map scores.")
+        picked = []
+    viral_segments = select_segments.select_top_segments(
+        picked, num_segments, tempo_minimo, tempo_maximo, video_end_ms=video_end_ms
+    )
+    viral_segments = select_segments.top_up(
+        viral_segments, candidates, num_segments, tempo_minimo, tempo_maximo, video_end_ms=video_end_ms
+    )
+    viral_segments = time_index.snap_segments(viral_segments, tempo_minimo, tempo_maximo)
+
+    result_data = {
+        "segments": viral_segments,
+        "tags": _merge_tags(documents)
+    }
+
+    save_viral_segments(result_data)
+    return result_data
+
+def create_viral_segments_streaming(num_segments, instructions, tempo_minimo, tempo_maximo, client, on_segment, generate_title=False, max_concurrency=None, cache_prefix=None):
+    """
+    Streaming variant of create_viral_segments. Calls on_segment(index,
+    segment) from the worker threads for every segment accepted by a
+    StreamingSelector while the chunk responses are still arriving, so
+    rendering can start before the last response is in. Returns the same
+    document as create_viral_segments.
+    """
+    output_txt_file = "tmp/viral_segments.txt"
+    if os.path.exists(output_txt_file):
+        result_data = read_json_file(output_txt_file)
+        for i, segment in enumerate(result_data["segments"]):
+            on_segment(i, segment)
+        return result_data
+
+    output_prompts = build_chunk_prompts(num_segments, instructions, tempo_minimo, tempo_maximo, client)
+    if output_prompts is None:
+        return {"segments": [], "tags": []}
+
+    video_end_ms = _video_end_ms()
+    selector = select_segments.StreamingSelector(num_segments, tempo_minimo, tempo_maximo, video_end_ms=video_end_ms)
+    index = time_index.snap_index()
+
+    def handle_segment(segment):
+        if index is not None and segment.get("start_time") is not None and segment.get("end_time") is not None:
+            clamped = select_segments.clamp_duration(segment, tempo_minimo, tempo_maximo, video_end_ms)
+            segment = index.snap_segment(clamped, tempo_minimo, tempo_maximo)
+        accepted = selector.offer(segment)
+        if accepted is not None:
+            print(f"Streaming segment {accepted[0]}: {segment.get('title')}")
+            on_segment(*accepted)
+
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv('GEMINI_MAX_CONCURRENCY', '4'))
+    max_concurrency = max(1, min(max_concurrency, len(output_prompts)))
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        documents = list(executor.map(lambda prompt: stream_chunk(client, prompt, handle_segment, cache_prefix), output_prompts))
+    print(f"[rate_limiter:gemini] {gemini_limiter().stats()}")
+    print(f"[hedge] {hedging_stats()}")
+
+    result_data = {
+        "segments": selector.accepted,
+        "tags": _merge_tags(documents)
+    }
+
+    save_viral_segments(result_data)
+    return result_data
+
 def save_viral_segments(segments_data=None):
     output_txt_file = "tmp/viral_segments.txt"
     try:
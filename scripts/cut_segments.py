@@ -1,47 +1,82 @@
 import subprocess
 import os
 from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from scripts.burn_subtitles import fused_render_enabled
 
-def cut(segments):
-    def check_nvenc_support():
-        try:
-            result = subprocess.run(["ffmpeg", "-encoders"], capture_output=True, text=True)
-            return "h264_nvenc" in result.stdout
-        except subprocess.CalledProcessError:
-            return False
-
-    def process_segment(args):
-        i, segment, video_codec = args
-        input_file = "tmp/input_video.mp4"
-        start_time = segment["start_time"]
-        end_time = segment["end_time"]
-        duration = (end_time - start_time) / 1000
-        output_file = f"tmp/output{str(i).zfill(3)}_original_scale.mp4"
-        
-        if os.path.exists(output_file):
-            return
+@lru_cache(maxsize=None)
+def check_nvenc_support():
+    try:
+        result = subprocess.run(["ffmpeg", "-encoders"], capture_output=True, text=True)
+        return "h264_nvenc" in result.stdout
+    except subprocess.CalledProcessError:
+        return False
+
+def stream_copy_enabled():
+    """
+    Whether keyframe-aligned segments are stream-copied (CUT_STREAM_COPY,
+    default true). Fused rendering never reads the cuts, so it turns this off.
+    """
+    return os.getenv('CUT_STREAM_COPY', 'true').lower() == 'true' and not fused_render_enabled()
+
+def cut_segment(i, segment, video_codec=None):
+    """
+    Cuts a single segment out of tmp/input_video.mp4. Segments that start
+    on a keyframe are stream-copied instead of re-encoded when
+    stream_copy_enabled().
+    """
+    if video_codec is None:
+        video_codec = "h264_nvenc" if check_nvenc_support() else "libx264"
 
+    input_file = "tmp/input_video.mp4"
+    start_time = segment["start_time"]
+    end_time = segment["end_time"]
+    duration = (end_time - start_time) / 1000
+    output_file = f"tmp/output{str(i).zfill(3)}_original_scale.mp4"
+    
+    if os.path.exists(output_file):
+        return
+
+    if segment.get("keyframe_aligned") and stream_copy_enabled():
+        # Seeking just past the keyframe still lands on it with -c copy and
+        # is safe against the start being rounded down to the previous one.
         command = [
             "ffmpeg", "-y",
-            "-ss", str(int(start_time)/1000),
+            "-ss", f"{start_time / 1000 + 0.001:.6f}",
             "-i", input_file,
             "-t", str(duration),
-            "-c:v", video_codec
+            "-c", "copy", "-avoid_negative_ts", "make_zero",
+            output_file
         ]
-
-        if video_codec == "h264_nvenc":
-            command.extend(["-preset", "p1", "-b:v", "5M"])
-        else:
-            command.extend(["-preset", "ultrafast", "-crf", "23"])
-
-        command.extend(["-c:a", "aac", "-b:a", "128k", output_file])
-
         try:
             subprocess.run(command, check=True, capture_output=True, text=True)
-            print(f"Generated segment {i}")
+            print(f"Generated segment {i} (stream copy)")
+            return
         except subprocess.CalledProcessError as e:
-            print(f"Error generating segment {i}: {e}")
+            print(f"Stream copy of segment {i} failed, re-encoding: {e}")
+
+    command = [
+        "ffmpeg", "-y",
+        "-ss", str(int(start_time)/1000),
+        "-i", input_file,
+        "-t", str(duration),
+        "-c:v", video_codec
+    ]
 
+    if video_codec == "h264_nvenc":
+        command.extend(["-preset", "p1", "-b:v", "5M"])
+    else:
+        command.extend(["-preset", "ultrafast", "-crf", "23"])
+
+    command.extend(["-c:a", "aac", "-b:a", "128k", output_file])
+
+    try:
+        subprocess.run(command, check=True, capture_output=True, text=True)
+        print(f"Generated segment {i}")
+    except subprocess.CalledProcessError as e:
+        print(f"Error generating segment {i}: {e}")
+
+def cut(segments):
     if not os.path.exists("tmp/input_video.mp4"):
         print("Input file not found.")
         return
@@ -51,4 +86,4 @@ def cut(segments):
     tasks = [(i, seg, video_codec) for i, seg in enumerate(segments)]
     
     with ThreadPoolExecutor(max_workers=4) as executor:
-        executor.map(process_segment, tasks)
\ No newline at end of file
+        executor.map(lambda task: cut_segment(*task), tasks)
\ No newline at end of file
@@ -14,4 +14,12 @@ def download(storage_path):
     blob = bucket.blob(blob_path)
     blob.download_to_filename(output_path)
 
-    return output_path
\ No newline at end of file
+    return output_path
+
+def source_cache_prefix(storage_path, name):
+    """
+    Bucket prefix for cached artifacts derived from the source at storage_path,
+    stored next to it so they share its lifetime and access rules.
+    """
+    source_dir = os.path.dirname(storage_path.lstrip('/'))
+    return '/'.join(part for part in [source_dir, '.cache', name] if part)
\ No newline at end of file
@@ -0,0 +1,216 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class LatencyTracker:
+    """Rolling window of call latencies used to derive the hedge delay."""
+
+    def __init__(self, size=200, min_samples=20):
+        self._samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling out while a circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and stays open for
+    reset_seconds. After that a single trial call is let through: success
+    closes the breaker, failure opens it again. Every call allow() lets
+    through must end in record_success() or record_failure(), or the trial
+    never finishes and the breaker stays open.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_seconds=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_seconds and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_running:
+                    self.opened += 1
+                    print(f"[circuit:{self.name}] open after {self._failures} failures")
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+
+class StagePolicy:
+    """
+    Deadline and hedging policy for the calls of one stage. call() gives up
+    with TimeoutError once deadline_seconds have passed. With hedging on, a
+    duplicate request is sent once the first has been outstanding longer than
+    the observed p95 latency (or hedge_min_seconds until enough samples
+    exist), and whichever answer arrives first wins. Python threads cannot be
+    cancelled, so the losing call is left to finish or hit its own HTTP
+    timeout in the background.
+    """
+
+    def __init__(self, stage, deadline_seconds=None, hedge=False, hedge_quantile=0.95, hedge_min_seconds=5.0, max_workers=16):
+        self.stage = stage
+        self.deadline_seconds = deadline_seconds
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_seconds = hedge_min_seconds
+        self.latencies = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"hedge-{stage}")
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.deadlines_exceeded = 0
+
+    def hedge_delay(self):
+        observed = self.latencies.quantile(self.hedge_quantile)
+        return max(self.hedge_min_seconds, observed) if observed is not None else self.hedge_min_seconds
+
+    def _timed(self, fn):
+        started = time.monotonic()
+        result = fn()
+        self.latencies.record(time.monotonic() - started)
+        return result
+
+    def call(self, fn):
+        with self._lock:
+            self.calls += 1
+        if self.deadline_seconds is None and not self.hedge:
+            return self._timed(fn)
+
+        started = time.monotonic()
+        deadline = started + self.deadline_seconds if self.deadline_seconds else None
+        primary = self._executor.submit(self._timed, fn)
+        pending = {primary}
+
+        if self.hedge:
+            delay = self.hedge_delay()
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline - time.monotonic()))
+            done, _ = wait(pending, timeout=delay)
+            if not done and (deadline is None or time.monotonic() < deadline):
+                with self._lock:
+                    self.hedges_fired += 1
+                print(f"[hedge:{self.stage}] no answer after {delay:.1f}s, sending a hedged request")
+                pending.add(self._executor.submit(self._timed, fn))
+
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        with self._lock:
+                            self.hedges_won += 1
+                    return future.result()
+            if not pending:
+                # Every attempt failed; surface the primary's error.
+                return primary.result()
+
+        with self._lock:
+            self.deadlines_exceeded += 1
+        raise TimeoutError(f"{self.stage} call exceeded its {self.deadline_seconds}s deadline")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedges_fired": self.hedges_fired,
+                "hedges_won": self.hedges_won,
+                "deadlines_exceeded": self.deadlines_exceeded,
+                "hedge_delay_seconds": round(self.hedge_delay(), 3),
+                "deadline_seconds": self.deadline_seconds,
+            }
+
+
+# Defaults per stage: (deadline seconds, hedge). Overridden with
+# GEMINI_<STAGE>_DEADLINE_SECONDS (0 disables), GEMINI_<STAGE>_HEDGE and
+# GEMINI_<STAGE>_HEDGE_MIN_SECONDS.
+STAGE_DEFAULTS = {
+    "selection": (180.0, False),
+    "repair": (30.0, False),
+    "reduce": (60.0, False),
+    "stream": (300.0, False),
+}
+
+_policies = {}
+_policies_lock = threading.Lock()
+_breaker = None
+
+
+def stage_policy(stage):
+    with _policies_lock:
+        if stage not in _policies:
+            deadline, hedge = STAGE_DEFAULTS.get(stage, (None, False))
+            prefix = f"GEMINI_{stage.upper()}"
+            deadline = float(os.getenv(f"{prefix}_DEADLINE_SECONDS", str(deadline or 0))) or None
+            hedge = os.getenv(f"{prefix}_HEDGE", str(hedge)).lower() == 'true'
+            _policies[stage] = StagePolicy(
+                stage,
+                deadline_seconds=deadline,
+                hedge=hedge,
+                hedge_min_seconds=float(os.getenv(f"{prefix}_HEDGE_MIN_SECONDS", '20')),
+            )
+        return _policies[stage]
+
+
+def gemini_breaker():
+    global _breaker
+    with _policies_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(
+                "gemini",
+                failure_threshold=int(os.getenv('GEMINI_BREAKER_FAILURES', '5')),
+                reset_seconds=float(os.getenv('GEMINI_BREAKER_RESET_SECONDS', '60')),
+            )
+        return _breaker
+
+
+def hedging_stats():
+    with _policies_lock:
+        policies = dict(_policies)
+    return {stage: policy.stats() for stage, policy in policies.items()}
@@ -0,0 +1,253 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from google.genai import types
+from scripts.rate_limiter import gemini_limiter
+from scripts.transcript_format import estimate_tokens
+
+GEMINI_MODEL = 'gemini-2.5-flash'
+
+
+def generation_config(response_schema, timeout_seconds=None):
+    if response_schema is None and timeout_seconds is None:
+        return None
+    config = types.GenerateContentConfig()
+    if response_schema is not None:
+        config.response_mime_type = "application/json"
+        config.response_schema = response_schema
+    if timeout_seconds is not None:
+        config.http_options = types.HttpOptions(timeout=int(timeout_seconds * 1000))
+    return config
+
+
+def _contents(prompt):
+    return [
+        {
+            'role': 'user',
+            'parts': [{'text': prompt}],
+        },
+    ]
+
+
+def _token_estimate(prompt):
+    return estimate_tokens(prompt) + int(os.getenv('GEMINI_OUTPUT_TOKEN_RESERVE', '2048'))
+
+
+class GenAIBackend:
+    """
+    The live Vertex AI / Gemini client. Every call waits for a slot from the
+    process-wide Gemini rate limiter first; timeout_seconds bounds the HTTP
+    request itself.
+    """
+
+    remote = True
+
+    def __init__(self, client, model=GEMINI_MODEL):
+        self.client = client
+        self.model = model
+        self.name = model
+
+    def generate(self, prompt, response_schema=None, timeout_seconds=None):
+        with gemini_limiter().slot(_token_estimate(prompt)):
+            response = self.client.models.generate_content(
+                model=self.model,
+                contents=_contents(prompt),
+                config=generation_config(response_schema, timeout_seconds),
+            )
+        return response.text
+
+    def stream(self, prompt, response_schema=None, timeout_seconds=None):
+        with gemini_limiter().slot(_token_estimate(prompt)):
+            for chunk in self.client.models.generate_content_stream(
+                model=self.model,
+                contents=_contents(prompt),
+                config=generation_config(response_schema, timeout_seconds),
+            ):
+                if chunk.text:
+                    yield chunk.text
+
+
+LINE_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)[-\t](\d+(?:\.\d+)?)[ \t](.+)$', re.MULTILINE)
+UNIT_PATTERN = re.compile(r'start and end time in (seconds|milliseconds|units of (\d+) milliseconds)')
+COUNT_PATTERN = re.compile(r'totals at least \*\*(\d+)\*\*')
+DURATION_PATTERN = re.compile(r'minimum duration of (\d+(?:\.\d+)?) and maximum of (\d+(?:\.\d+)?) seconds')
+
+
+class HeuristicBackend:
+    """
+    Deterministic offline stand-in for Gemini. It reads the transcript lines,
+    segment count and duration limits back out of the segment-selection
+    prompt and answers with the densest, most exclamatory non-overlapping
+    spans, in the same JSON document the model returns. Prompts it does not
+    recognise (e.g. repair prompts) get an empty document.
+    """
+
+    name = "heuristic"
+    remote = False
+
+    def generate(self, prompt, response_schema=None, timeout_seconds=None):
+        return json.dumps(self.select(prompt), ensure_ascii=False)
+
+    def stream(self, prompt, response_schema=None, timeout_seconds=None, piece_size=256):
+        text = self.generate(prompt, response_schema)
+        for start in range(0, len(text), piece_size):
+            yield text[start:start + piece_size]
+
+    def select(self, prompt):
+        transcript = prompt.split("## TRANSCRIPT CHUNK", 1)[-1].split("## JSON OUTPUT FORMAT", 1)[0]
+        lines = [(float(a), float(b), text) for a, b, text in LINE_PATTERN.findall(transcript)]
+        if not lines or "## TRANSCRIPT CHUNK" not in prompt:
+            return {"tags": [], "segments": []}
+
+        unit = UNIT_PATTERN.search(prompt)
+        if unit is None or unit.group(1) == "seconds":
+            unit_ms = 1000.0
+        elif unit.group(1) == "milliseconds":
+            unit_ms = 1.0
+        else:
+            unit_ms = float(unit.group(2))
+        count = COUNT_PATTERN.search(prompt)
+        count = int(count.group(1)) if count else 3
+        durations = DURATION_PATTERN.search(prompt)
+        min_ms, max_ms = (float(durations.group(1)) * 1000, float(durations.group(2)) * 1000) if durations else (15000.0, 60000.0)
+
+        candidates = []
+        for i, (start, _, _) in enumerate(lines):
+            start_ms = start * unit_ms
+            words = 0
+            lively = 0
+            for line_start, line_end, text in lines[i:]:
+                end_ms = line_end * unit_ms
+                if end_ms - start_ms > max_ms:
+                    break
+                words += len(text.split())
+                lively += text.count('!') + text.count('?')
+                if end_ms - start_ms >= min_ms:
+                    words_per_second = words / ((end_ms - start_ms) / 1000)
+                    score = min(100.0, 10 * words_per_second + 200 * lively / max(words, 1))
+                    candidates.append((score, start_ms, end_ms))
+                    break
+
+        segments = []
+        for score, start_ms, end_ms in sorted(candidates, key=lambda c: (-c[0], c[1])):
+            if len(segments) >= count:
+                break
+            if any(start_ms < s["end_time"] and end_ms > s["start_time"] for s in segments):
+                continue
+            segments.append({
+                "title": " ".join(self._title_words(lines, start_ms / unit_ms)),
+                "start_time": start_ms,
+                "end_time": end_ms,
+                "score": round(score, 1),
+                "duration": round((end_ms - start_ms) / 1000, 3),
+                "summary": " ".join(self._span_text(lines, start_ms / unit_ms, end_ms / unit_ms).split()[:20]),
+            })
+        return {"tags": ["heuristic"], "segments": sorted(segments, key=lambda s: s["start_time"])}
+
+    @staticmethod
+    def _span_text(lines, start, end):
+        return " ".join(text for line_start, line_end, text in lines if line_start >= start and line_end <= end)
+
+    @staticmethod
+    def _title_words(lines, start):
+        for line_start, _, text in lines:
+            if line_start >= start:
+                return text.split()[:4]
+        return ["Segment"]
+
+
+class RecordReplayBackend:
+    """
+    Stores prompt -> response pairs on disk, one JSON file per prompt. In
+    "record" mode every call goes to the wrapped backend and is saved; in
+    "replay" mode responses come only from disk and a missing prompt raises
+    KeyError; "auto" replays when it can and records otherwise.
+    """
+
+    def __init__(self, directory, backend=None, mode="auto"):
+        if mode not in ("record", "replay", "auto"):
+            raise ValueError(f"Unknown record/replay mode: {mode}")
+        if mode != "replay" and backend is None:
+            raise ValueError("Recording needs a backend to forward calls to")
+        self.directory = directory
+        self.backend = backend
+        self.mode = mode
+        self.name = f"replay:{backend.name}" if backend is not None else "replay"
+        self.remote = mode != "replay" and getattr(backend, "remote", False)
+        self._lock = threading.Lock()
+
+    def _path(self, prompt, response_schema):
+        schema = getattr(response_schema, "__name__", str(response_schema)) if response_schema is not None else ""
+        key = hashlib.sha256(f"{schema}\n{prompt}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["response"]
+        except FileNotFoundError:
+            return None
+
+    def _save(self, path, prompt, response):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"prompt": prompt, "response": response}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+
+    def generate(self, prompt, response_schema=None, timeout_seconds=None):
+        path = self._path(prompt, response_schema)
+        if self.mode != "record":
+            response = self._load(path)
+            if response is not None:
+                return response
+            if self.mode == "replay":
+                raise KeyError(f"No recorded response for prompt {os.path.basename(path)}")
+
+        response = self.backend.generate(prompt, response_schema, timeout_seconds)
+        self._save(path, prompt, response)
+        return response
+
+    def stream(self, prompt, response_schema=None, timeout_seconds=None, piece_size=256):
+        path = self._path(prompt, response_schema)
+        if self.mode != "record":
+            response = self._load(path)
+            if response is not None:
+                for start in range(0, len(response), piece_size):
+                    yield response[start:start + piece_size]
+                return
+            if self.mode == "replay":
+                raise KeyError(f"No recorded response for prompt {os.path.basename(path)}")
+
+        pieces = []
+        for piece in self.backend.stream(prompt, response_schema, timeout_seconds):
+            pieces.append(piece)
+            yield piece
+        self._save(path, prompt, "".join(pieces))
+
+
+def as_backend(client):
+    """Wraps a raw genai client; backends and None pass through unchanged."""
+    if client is None or hasattr(client, "generate"):
+        return client
+    return GenAIBackend(client)
+
+
+def backend_from_env(client=None):
+    """
+    Picks the segment-selection backend from LLM_BACKEND: "genai" (default),
+    "heuristic", or "record"/"replay"/"auto" around the genai client, with
+    recordings in LLM_REPLAY_DIR.
+    """
+    kind = os.getenv('LLM_BACKEND', 'genai').lower()
+    if kind == 'genai':
+        return as_backend(client)
+    if kind == 'heuristic':
+        return HeuristicBackend()
+    if kind in ('record', 'replay', 'auto'):
+        directory = os.getenv('LLM_REPLAY_DIR', '/tmp/shorts-llm-replay')
+        return RecordReplayBackend(directory, backend=as_backend(client), mode=kind)
+    raise ValueError(f"Unknown LLM_BACKEND: {kind}")
@@ -0,0 +1,195 @@
+import threading
+import time
+import contextlib
+from collections import OrderedDict
+
+
+class _Entry:
+    def __init__(self, value, size_mb):
+        self.value = value
+        self.size_mb = size_mb
+        self.refs = 0
+        self.last_used = time.monotonic()
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models shared by every request handled by
+    this worker. Entries are kept in LRU order and evicted once the sum of
+    their estimated sizes exceeds budget_mb, once more than max_entries are
+    resident, or once they have sat idle for longer than ttl_seconds. Models
+    currently leased by a request are never evicted; they are dropped once
+    released instead. Any limit left as None is not enforced.
+
+    Leasing only protects a model from eviction. Models that are not safe to
+    call from several threads at once (e.g. whisperx pipelines) need
+    exclusive=True, which makes lease() hold a per-key lock for the whole
+    lease so concurrent requests take turns on the shared instance.
+    """
+
+    def __init__(self, name, budget_mb=None, on_evict=None, max_entries=None, ttl_seconds=None, exclusive=False):
+        self.name = name
+        self.exclusive = exclusive
+        self.budget_mb = budget_mb
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._use_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def _key_lock(self, key):
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def _use_lock(self, key):
+        with self._lock:
+            if key not in self._use_locks:
+                # Re-entrant so nested leases of the same key in one thread do not deadlock.
+                self._use_locks[key] = threading.RLock()
+            return self._use_locks[key]
+
+    def acquire(self, key, loader, size_mb=0):
+        """
+        Returns the model stored under key, calling loader() on a miss.
+        Concurrent misses on the same key wait for a single load.
+        """
+        with self._lock:
+            expired = self._evict_locked()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._touch_locked(key, entry)
+                self._log("hit", key)
+        self._dispose(expired)
+        if entry is not None:
+            return entry.value
+
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._touch_locked(key, entry)
+                    self._log("hit", key)
+                    return entry.value
+
+            started = time.perf_counter()
+            value = loader()
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                entry = _Entry(value, size_mb)
+                entry.refs = 1
+                self._entries[key] = entry
+                self.misses += 1
+                self.load_seconds += elapsed
+                self._log(f"miss (loaded in {elapsed:.2f}s)", key)
+                evicted = self._evict_locked()
+
+        self._dispose(evicted)
+        return value
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.refs > 0:
+                entry.refs -= 1
+                entry.last_used = time.monotonic()
+            evicted = self._evict_locked()
+        self._dispose(evicted)
+
+    @contextlib.contextmanager
+    def lease(self, key, loader, size_mb=0):
+        """
+        Yields the model stored under key for the duration of the block. In
+        an exclusive registry no other thread can lease the same key until
+        the block exits.
+        """
+        use_lock = self._use_lock(key) if self.exclusive else contextlib.nullcontext()
+        with use_lock:
+            value = self.acquire(key, loader, size_mb)
+            try:
+                yield value
+            finally:
+                self.release(key)
+
+    def clear(self):
+        with self._lock:
+            evicted = [(key, entry.value) for key, entry in self._entries.items() if entry.refs == 0]
+            for key, _ in evicted:
+                del self._entries[key]
+                self.evictions += 1
+        self._dispose(evicted)
+
+    def resident_mb(self):
+        with self._lock:
+            return sum(entry.size_mb for entry in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "load_seconds": round(self.load_seconds, 3),
+                "resident": len(self._entries),
+                "resident_mb": sum(entry.size_mb for entry in self._entries.values()),
+                "budget_mb": self.budget_mb,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+    def _touch_locked(self, key, entry):
+        entry.refs += 1
+        entry.last_used = time.monotonic()
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+    def _over_limits_locked(self, total_mb):
+        if self.budget_mb is not None and total_mb > self.budget_mb:
+            return True
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        return False
+
+    def _evict_locked(self):
+        evicted = []
+        now = time.monotonic()
+
+        def drop(key, entry):
+            del self._entries[key]
+            self.evictions += 1
+            evicted.append((key, entry.value))
+
+        if self.ttl_seconds is not None:
+            for key, entry in list(self._entries.items()):
+                if entry.refs == 0 and now - entry.last_used > self.ttl_seconds:
+                    drop(key, entry)
+
+        total = sum(entry.size_mb for entry in self._entries.values())
+        for key, entry in list(self._entries.items()):
+            if not self._over_limits_locked(total):
+                break
+            if entry.refs > 0:
+                continue
+            drop(key, entry)
+            total -= entry.size_mb
+        return evicted
+
+    def _dispose(self, evicted):
+        for key, value in evicted:
+            print(f"[model_registry:{self.name}] evicted {key}")
+            if self.on_evict:
+                self.on_evict(value)
+
+    def _log(self, event, key):
+        print(
+            f"[model_registry:{self.name}] {event} {key} "
+            f"hits={self.hits} misses={self.misses} load_seconds={self.load_seconds:.2f}"
+        )
@@ -0,0 +1,220 @@
+import os
+import re
+import json
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import whisperx
+from whisperx.audio import SAMPLE_RATE
+from scripts.batched_asr import log_throughput
+from scripts.audio_extract import extract_audio, open_audio
+from scripts.whisper_gen import (
+    load_transcription_model,
+    alignment_model,
+    output_paths,
+    save_as_tsv,
+    shift_segment,
+)
+
+# Per-process state of pool workers.
+_worker_model = None
+_worker_device = None
+
+_pool = None
+_pool_config = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(model_name, compute_type, threads):
+    global _worker_model, _worker_device
+    _worker_model, _worker_device = load_transcription_model(model_name, compute_type, threads=threads)
+
+
+def _transcribe_span(audio_path, start_sample, end_sample, language):
+    audio = open_audio(audio_path)
+    span = np.array(audio[start_sample:end_sample], dtype=np.float32)
+    offset = start_sample / SAMPLE_RATE
+
+    result = _worker_model.transcribe(span, batch_size=4, language=language)
+    span_language = result["language"]
+    with alignment_model(span_language, _worker_device) as (model_a, metadata):
+        aligned = whisperx.align(
+            result["segments"],
+            model_a,
+            metadata,
+            span,
+            device=_worker_device,
+            return_char_alignments=False
+        )
+
+    segments = [shift_segment(segment, offset) for segment in aligned["segments"]]
+    return {"segments": segments, "language": span_language}
+
+
+def get_pool(workers, model_name, compute_type, threads):
+    """
+    Returns a process pool whose workers each hold their own model. The pool
+    is kept for the lifetime of the instance so warm requests skip the load.
+    """
+    global _pool, _pool_config
+    config = (workers, model_name, compute_type, threads)
+    with _pool_lock:
+        if _pool is not None and _pool_config != config:
+            _pool.shutdown(wait=True)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_name, compute_type, threads),
+            )
+            _pool_config = config
+        return _pool
+
+
+def shutdown_pool():
+    global _pool, _pool_config
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool = None
+        _pool_config = None
+
+
+def frame_rms(audio, frame, block_frames=6000):
+    """RMS of each whole frame of audio, reduced a block of frames at a time so no full-length copy is made."""
+    n_frames = len(audio) // frame
+    rms = np.zeros(n_frames, dtype=np.float64)
+    for start in range(0, n_frames, block_frames):
+        end = min(n_frames, start + block_frames)
+        block = np.asarray(audio[start * frame:end * frame], dtype=np.float32).reshape(end - start, frame)
+        rms[start:end] = np.sqrt(np.einsum('ij,ij->i', block, block, dtype=np.float64) / frame)
+    return rms
+
+
+def find_split_points(audio, n_spans, search_seconds=20.0, frame_seconds=0.1):
+    """
+    Splits audio into n_spans roughly equal spans, moving every boundary to
+    the quietest frame within search_seconds of its ideal position so cuts
+    fall into pauses rather than mid-word. Returns sample boundaries,
+    including 0 and len(audio).
+    """
+    total = len(audio)
+    if n_spans <= 1 or total == 0:
+        return [0, total]
+
+    frame = int(frame_seconds * SAMPLE_RATE)
+    rms = frame_rms(audio, frame)
+    n_frames = len(rms)
+
+    radius = int(search_seconds / frame_seconds)
+    boundaries = [0]
+    for k in range(1, n_spans):
+        ideal = int(n_frames * k / n_spans)
+        lo = max(ideal - radius, 1)
+        hi = min(ideal + radius, n_frames - 1)
+        if hi <= lo:
+            continue
+        quietest = lo + int(np.argmin(rms[lo:hi]))
+        sample = quietest * frame + frame // 2
+        if sample > boundaries[-1]:
+            boundaries.append(sample)
+    boundaries.append(total)
+    return boundaries
+
+
+def _normalize(word):
+    return re.sub(r'[^\w]', '', word.lower())
+
+
+def merge_span_results(span_results, tolerance=0.05, repeat_window=1.0):
+    """
+    Concatenates per-span results in order. Words that overlap the previous
+    span's last word, or repeat it within repeat_window seconds, are treated
+    as seam duplicates and dropped.
+    """
+    merged = []
+    last_end = None
+    last_word = None
+
+    for result in span_results:
+        at_seam = last_word is not None
+        for segment in result["segments"]:
+            kept = []
+            for word in segment.get('words', []):
+                if at_seam and 'start' in word:
+                    if word['start'] < last_end - tolerance:
+                        continue
+                    if (
+                        _normalize(word.get('word', '')) == _normalize(last_word.get('word', ''))
+                        and word['start'] - last_word['end'] < repeat_window
+                    ):
+                        continue
+                    at_seam = False
+                kept.append(word)
+
+            timed = [w for w in kept if 'start' in w]
+            if not timed:
+                continue
+
+            segment = {
+                **segment,
+                'start': timed[0]['start'],
+                'end': max(timed[-1]['end'], timed[0]['start']),
+                'text': " ".join(w['word'].strip() for w in kept if w.get('word')),
+                'words': kept,
+            }
+            merged.append(segment)
+            last_word = timed[-1]
+            last_end = timed[-1]['end']
+
+    return merged
+
+
+def transcribe_parallel(input_file, output_folder, model_name, compute_type='int8', workers=2, threads=None, language=None):
+    """
+    Splits the input at pauses into `workers` spans and transcribes them in a
+    process pool, each worker holding its own model limited to `threads`
+    ctranslate2 threads, then merges the spans with corrected timestamps.
+    """
+    json_output_path, tsv_output_path = output_paths(input_file, output_folder)
+
+    if os.path.exists(json_output_path):
+        print(f"Skipping: {json_output_path} already exists.")
+        return
+
+    os.makedirs(output_folder, exist_ok=True)
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    print(f"Transcribing {input_file} with {workers} workers x {threads} threads...")
+
+    started = time.perf_counter()
+    # Workers map the shared extracted buffer; the path is absolute because
+    # they outlive the request's working directory.
+    audio_path = os.path.abspath(extract_audio(input_file))
+    audio = open_audio(audio_path)
+    boundaries = find_split_points(audio, workers)
+    audio_seconds = len(audio) / SAMPLE_RATE
+    del audio
+
+    pool = get_pool(workers, model_name, compute_type, threads)
+    futures = [
+        pool.submit(_transcribe_span, audio_path, start, end, language)
+        for start, end in zip(boundaries[:-1], boundaries[1:])
+    ]
+    span_results = [future.result() for future in futures]
+
+    result = {
+        "segments": merge_span_results(span_results),
+        "language": language or (span_results[0]["language"] if span_results else None),
+    }
+
+    print(f"Saving to {json_output_path}...")
+    with open(json_output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    save_as_tsv(result["segments"], tsv_output_path)
+
+    log_throughput(f"parallel:{workers}x{threads}", audio_seconds, time.perf_counter() - started)
+    return result
@@ -0,0 +1,172 @@
+import os
+import json
+import numpy as np
+from scripts.audio_extract import SAMPLE_RATE, extracted_path, open_audio
+
+FEATURE_WEIGHTS = {
+    "speech_density": 1.0,
+    "words_per_second": 0.75,
+    "long_pauses": -0.75,
+    "punctuation_rate": 0.5,
+    "exclamation_rate": 0.75,
+    "rms_mean": 0.5,
+    "rms_variation": 0.5,
+}
+
+
+def load_words(transcript_path='tmp/input_video.json'):
+    """
+    Returns (starts, ends, texts) for every timed word of the aligned
+    transcript. Words whisperx could not align are skipped.
+    """
+    try:
+        with open(transcript_path, 'r', encoding='utf-8') as f:
+            transcript = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return np.zeros(0), np.zeros(0), []
+
+    words = transcript.get('word_segments')
+    if not words:
+        words = [w for seg in transcript.get('segments', []) for w in seg.get('words', [])]
+    timed = [w for w in words if 'start' in w and 'end' in w]
+    starts = np.array([w['start'] for w in timed], dtype=np.float64)
+    ends = np.array([w['end'] for w in timed], dtype=np.float64)
+    return starts, ends, [w.get('word', '') for w in timed]
+
+
+def rms_per_second(audio, n_seconds, sr=SAMPLE_RATE, block_seconds=600):
+    """
+    RMS energy of each whole second of audio, zero past the end. The track
+    is reduced block_seconds at a time, so no full-length copy is made.
+    """
+    rms = np.zeros(n_seconds, dtype=np.float64)
+    usable = min(n_seconds, len(audio) // sr)
+    for start in range(0, usable, block_seconds):
+        end = min(usable, start + block_seconds)
+        block = np.asarray(audio[start * sr:end * sr], dtype=np.float32).reshape(end - start, sr)
+        rms[start:end] = np.sqrt(np.einsum('ij,ij->i', block, block, dtype=np.float64) / sr)
+    return rms
+
+
+def _window_sums(per_second, window):
+    cumulative = np.concatenate(([0.0], np.cumsum(per_second)))
+    return cumulative[window:] - cumulative[:-window]
+
+
+def _zscore(values):
+    std = values.std()
+    if std == 0:
+        return np.zeros_like(values)
+    return (values - values.mean()) / std
+
+
+def window_features(starts, ends, texts, duration, window_seconds, audio=None, pause_seconds=1.0):
+    """
+    Computes one row of features per window start (one-second hop). Every
+    feature is built from one-second bins and summed over windows with a
+    cumulative sum, so the cost is linear in the video length.
+    """
+    n_seconds = max(1, int(np.ceil(duration)))
+    window = max(1, min(int(window_seconds), n_seconds))
+
+    start_bins = np.clip(starts.astype(np.int64), 0, n_seconds - 1)
+    words = np.bincount(start_bins, minlength=n_seconds).astype(np.float64)
+    speech = np.bincount(start_bins, weights=np.clip(ends - starts, 0, None), minlength=n_seconds)
+
+    punctuation = np.array([t.strip().endswith(('.', ',', '?', '!', '…')) for t in texts], dtype=np.float64)
+    exclamation = np.array([t.strip().endswith(('?', '!')) for t in texts], dtype=np.float64)
+    punctuation = np.bincount(start_bins, weights=punctuation, minlength=n_seconds)
+    exclamation = np.bincount(start_bins, weights=exclamation, minlength=n_seconds)
+
+    gaps = starts[1:] - ends[:-1]
+    long_pauses = np.bincount(start_bins[1:], weights=(gaps > pause_seconds).astype(np.float64), minlength=n_seconds)
+
+    word_counts = _window_sums(words, window)
+    safe_counts = np.maximum(word_counts, 1.0)
+    features = {
+        "speech_density": np.minimum(_window_sums(speech, window) / window, 1.0),
+        "words_per_second": word_counts / window,
+        "long_pauses": _window_sums(long_pauses, window),
+        "punctuation_rate": _window_sums(punctuation, window) / safe_counts,
+        "exclamation_rate": _window_sums(exclamation, window) / safe_counts,
+    }
+
+    if audio is not None and len(audio):
+        rms = rms_per_second(audio, n_seconds)
+        mean = _window_sums(rms, window) / window
+        mean_sq = _window_sums(rms * rms, window) / window
+        features["rms_mean"] = mean
+        features["rms_variation"] = np.sqrt(np.maximum(mean_sq - mean * mean, 0.0))
+    return features, window
+
+
+def score_windows(features, weights=FEATURE_WEIGHTS):
+    scores = None
+    for name, values in features.items():
+        term = weights.get(name, 0.0) * _zscore(values)
+        scores = term if scores is None else scores + term
+    return scores
+
+
+def top_windows(scores, window, k):
+    """
+    Greedily picks the k best-scoring window starts that do not overlap,
+    returned as (start, end) second ranges in time order.
+    """
+    taken = np.zeros(len(scores) + window, dtype=bool)
+    picked = []
+    for start in np.argsort(scores)[::-1]:
+        if len(picked) >= k:
+            break
+        if taken[start:start + window].any():
+            continue
+        taken[start:start + window] = True
+        picked.append((int(start), int(start) + window))
+    return sorted(picked)
+
+
+def merge_spans(spans, context_seconds, duration):
+    merged = []
+    for start, end in spans:
+        start = max(0.0, start - context_seconds)
+        end = min(duration, end + context_seconds)
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(span) for span in merged]
+
+
+def candidate_spans(num_segments, window_seconds, transcript_path='tmp/input_video.json', audio_path=None,
+                    candidates=None, context_seconds=None):
+    """
+    Ranks every window of the video on cheap local features and returns the
+    top candidates, padded with context and merged, as (start, end) seconds.
+    Returns None when there is nothing to rank or the candidates would cover
+    most of the video anyway.
+    """
+    starts, ends, texts = load_words(transcript_path)
+    if not len(starts):
+        return None
+
+    candidates = candidates or int(os.getenv('PRERANK_CANDIDATES_PER_SEGMENT', '3')) * max(1, int(num_segments))
+    if context_seconds is None:
+        context_seconds = float(os.getenv('PRERANK_CONTEXT_SECONDS', '15'))
+
+    duration = float(ends.max())
+    audio_path = audio_path or extracted_path(os.path.splitext(transcript_path)[0] + ".mp4")
+    audio = open_audio(audio_path) if os.path.exists(audio_path) else None
+
+    features, window = window_features(starts, ends, texts, duration, window_seconds, audio)
+    spans = merge_spans(top_windows(score_windows(features), window, candidates), context_seconds, duration)
+
+    covered = sum(end - start for start, end in spans)
+    if covered >= duration * float(os.getenv('PRERANK_MAX_COVERAGE', '0.8')):
+        return None
+    print(f"Pre-ranker kept {len(spans)} spans covering {covered:.0f}s of {duration:.0f}s")
+    return spans
+
+
+def filter_lines(lines, spans):
+    """Keeps the transcript lines that overlap any of the spans."""
+    return [line for line in lines if any(line[0] < end and line[1] > start for start, end in spans)]
@@ -0,0 +1,238 @@
+import os
+import re
+import time
+import random
+import threading
+import contextlib
+
+
+class SharedQuotaCounter:
+    """
+    Cross-instance quota backed by a single Firestore document holding the
+    requests and tokens spent in the current minute. Every instance reserves
+    through a transaction, so the sum across instances stays under the
+    project quota. Fixed one-minute windows keep it to one document write per
+    request.
+    """
+
+    def __init__(self, doc_path, rpm, tpm, db=None):
+        self.doc_path = doc_path
+        self.rpm = rpm
+        self.tpm = tpm
+        self._db = db
+
+    def _doc(self):
+        if self._db is None:
+            from firebase_admin import firestore
+            self._db = firestore.client()
+        return self._db.document(self.doc_path)
+
+    def reserve(self, requests, tokens):
+        """Returns 0 when the reservation was made, else seconds to wait."""
+        from firebase_admin import firestore
+
+        # A request larger than the whole budget waits for a fresh window
+        # instead of never fitting, as in RateLimiter._reserve_locally.
+        tokens = min(tokens, self.tpm)
+        now = time.time()
+        window = int(now // 60)
+        doc_ref = self._doc()
+
+        @firestore.transactional
+        def update(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            data = snapshot.to_dict() if snapshot.exists else {}
+            if data.get("window") != window:
+                data = {"window": window, "requests": 0, "tokens": 0}
+            if data["requests"] + requests > self.rpm or data["tokens"] + tokens > self.tpm:
+                return (window + 1) * 60 - now
+            transaction.set(doc_ref, {
+                "window": window,
+                "requests": data["requests"] + requests,
+                "tokens": data["tokens"] + tokens,
+            })
+            return 0.0
+
+        return update(self._db.transaction())
+
+
+class RateLimiter:
+    """
+    Process-wide limiter shared by every request handled by this worker:
+    token buckets for requests and tokens per minute, a cap on requests in
+    flight and, optionally, a SharedQuotaCounter across instances. A 429
+    reported through throttle() pauses every caller until the quota is
+    expected back instead of letting each one back off on its own. Any limit
+    left as None is not enforced.
+    """
+
+    def __init__(self, name, rpm=None, tpm=None, max_in_flight=None, shared=None):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_in_flight = max_in_flight
+        self.shared = shared
+        self._condition = threading.Condition()
+        self._request_budget = float(rpm) if rpm else 0.0
+        self._token_budget = float(tpm) if tpm else 0.0
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self.requests = 0
+        self.throttle_events = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _refill_locked(self, now):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        if self.rpm:
+            self._request_budget = min(float(self.rpm), self._request_budget + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._token_budget = min(float(self.tpm), self._token_budget + elapsed * self.tpm / 60)
+
+    def _delay_locked(self, tokens, now):
+        """Seconds until a request of this size may start, 0 if it may now."""
+        delays = [self._paused_until - now]
+        if self.max_in_flight and self._in_flight >= self.max_in_flight:
+            delays.append(1.0)
+        if self.rpm and self._request_budget < 1:
+            delays.append((1 - self._request_budget) * 60 / self.rpm)
+        if self.tpm:
+            # A request larger than the whole bucket waits for a full bucket.
+            needed = min(tokens, self.tpm)
+            if self._token_budget < needed:
+                delays.append((needed - self._token_budget) * 60 / self.tpm)
+        return max(delays + [0.0])
+
+    def _reserve_locally(self, tokens):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill_locked(now)
+                delay = self._delay_locked(tokens, now)
+                if delay <= 0:
+                    break
+                self._condition.wait(timeout=delay)
+            if self.rpm:
+                self._request_budget -= 1
+            if self.tpm:
+                self._token_budget -= min(tokens, self.tpm)
+            self._in_flight += 1
+
+    def _release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, tokens=0):
+        """Waits for capacity for one request of about `tokens` tokens."""
+        started = time.monotonic()
+        self._reserve_locally(tokens)
+        try:
+            while self.shared is not None:
+                try:
+                    delay = self.shared.reserve(1, tokens)
+                except Exception as e:
+                    print(f"[rate_limiter:{self.name}] Shared quota unavailable, using local limits only: {e}")
+                    break
+                if delay <= 0:
+                    break
+                time.sleep(delay + random.uniform(0, 1))
+        except BaseException:
+            self._release()
+            raise
+
+        waited = time.monotonic() - started
+        with self._condition:
+            self.requests += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        if waited > 1:
+            print(f"[rate_limiter:{self.name}] waited {waited:.2f}s for a slot")
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def throttle(self, retry_after):
+        """Records a quota rejection and holds back every caller for retry_after seconds."""
+        with self._condition:
+            self.throttle_events += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            # The server disagrees with our budget, so start refilling from empty.
+            self._request_budget = min(self._request_budget, 0.0)
+            self._condition.notify_all()
+        print(f"[rate_limiter:{self.name}] throttled, pausing {retry_after:.2f}s")
+
+    def stats(self):
+        with self._condition:
+            return {
+                "requests": self.requests,
+                "throttle_events": self.throttle_events,
+                "queue_wait_seconds": round(self.wait_seconds, 3),
+                "max_queue_wait_seconds": round(self.max_wait_seconds, 3),
+                "in_flight": self._in_flight,
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "max_in_flight": self.max_in_flight,
+            }
+
+
+RETRY_DELAY = re.compile(r"retry(?:Delay|_delay|-after)['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s?", re.IGNORECASE)
+
+
+def is_quota_error(error):
+    """True for quota rejections (429 / RESOURCE_EXHAUSTED), not for transient outages like 503."""
+    return getattr(error, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def retry_delay(error, attempt, base=1.0, cap=60.0):
+    """
+    Seconds to wait before retrying: the server's retry delay when the error
+    carries one, otherwise exponential backoff with full jitter so callers
+    that failed together do not retry together.
+    """
+    match = RETRY_DELAY.search(str(error))
+    if match:
+        return float(match.group(1)) + random.uniform(0, 1)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _optional_int(name, default):
+    value = os.getenv(name, default)
+    return int(value) if value not in (None, "", "0") else None
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def gemini_limiter():
+    """
+    The limiter in front of every Gemini call of this process, configured
+    from GEMINI_RPM, GEMINI_TPM and GEMINI_MAX_IN_FLIGHT (0 disables a limit)
+    and shared across instances through GEMINI_SHARED_QUOTA_DOC when set.
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            rpm = _optional_int('GEMINI_RPM', '60')
+            tpm = _optional_int('GEMINI_TPM', '1000000')
+            shared = None
+            if os.getenv('GEMINI_SHARED_QUOTA_DOC'):
+                shared = SharedQuotaCounter(
+                    os.getenv('GEMINI_SHARED_QUOTA_DOC'),
+                    _optional_int('GEMINI_SHARED_RPM', str(rpm or 0)) or float('inf'),
+                    _optional_int('GEMINI_SHARED_TPM', str(tpm or 0)) or float('inf'),
+                )
+            _limiter = RateLimiter(
+                "gemini",
+                rpm=rpm,
+                tpm=tpm,
+                max_in_flight=_optional_int('GEMINI_MAX_IN_FLIGHT', '8'),
+                shared=shared,
+            )
+        return _limiter
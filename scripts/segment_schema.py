@@ -0,0 +1,184 @@
+import re
+import json
+from typing import List
+from pydantic import BaseModel, ValidationError
+
+SEGMENTS_ARRAY = re.compile(r'"segments"\s*:\s*\[')
+
+
+class ViralSegment(BaseModel):
+    title: str
+    start_time: float
+    end_time: float
+    score: float
+    duration: float
+
+
+class ViralSegmentsDocument(BaseModel):
+    tags: List[str]
+    segments: List[ViralSegment]
+
+
+class SegmentCandidate(ViralSegment):
+    summary: str
+
+
+class CandidatesDocument(BaseModel):
+    tags: List[str]
+    segments: List[SegmentCandidate]
+
+
+class RankedPick(BaseModel):
+    candidate: int
+    score: float
+
+
+class RankingDocument(BaseModel):
+    picks: List[RankedPick]
+
+
+class ParsedDocument:
+    """
+    Result of validating a model response: the segments and tags that passed
+    validation, plus whatever could not be salvaged. `malformed` holds raw
+    segment objects that failed validation; `unparseable` holds the raw text
+    when it was not JSON at all.
+    """
+
+    def __init__(self, tags=None, segments=None, malformed=None, unparseable=None):
+        self.tags = tags or []
+        self.segments = segments or []
+        self.malformed = malformed or []
+        self.unparseable = unparseable
+
+    @property
+    def complete(self):
+        return not self.malformed and self.unparseable is None
+
+    def to_dict(self):
+        return {
+            "tags": list(self.tags),
+            "segments": [segment.model_dump() for segment in self.segments],
+        }
+
+
+def _loads_lenient(text):
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        pass
+    start = text.find('{') if text else -1
+    end = text.rfind('}') if text else -1
+    if start != -1 and end > start:
+        try:
+            return json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+def parse_document(text, segment_model=ViralSegment):
+    """
+    Validates a response against ViralSegmentsDocument (or a document of
+    segment_model objects). Valid segments are kept even when siblings are
+    malformed, so a single bad object does not throw away the rest of the
+    chunk.
+    """
+    data = _loads_lenient(text)
+    if not isinstance(data, dict):
+        return ParsedDocument(unparseable=text or "")
+
+    tags = [tag for tag in data.get("tags", []) if isinstance(tag, str)] if isinstance(data.get("tags"), list) else []
+    raw_segments = data.get("segments", [])
+    if not isinstance(raw_segments, list):
+        return ParsedDocument(tags=tags, unparseable=text)
+
+    segments = []
+    malformed = []
+    for raw in raw_segments:
+        try:
+            segments.append(segment_model.model_validate(raw))
+        except ValidationError:
+            malformed.append(raw)
+    return ParsedDocument(tags=tags, segments=segments, malformed=malformed)
+
+
+def parse_segment_list(text, segment_model=ViralSegment):
+    data = _loads_lenient(text)
+    if isinstance(data, dict):
+        data = data.get("segments")
+    if not isinstance(data, list):
+        return []
+    segments = []
+    for raw in data:
+        try:
+            segments.append(segment_model.model_validate(raw))
+        except ValidationError:
+            continue
+    return segments
+
+
+def parse_ranking(text):
+    data = _loads_lenient(text)
+    try:
+        return RankingDocument.model_validate(data)
+    except ValidationError:
+        return None
+
+
+class SegmentStreamParser:
+    """
+    Incrementally extracts segment objects from a streamed JSON document.
+    Text is fed as it arrives and every object that closes inside the
+    "segments" array is validated and returned once, so callers can act on a
+    segment before the rest of the response exists.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._array_start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+        self._done = False
+
+    def feed(self, text):
+        self.text += text
+        if self._array_start is None:
+            match = SEGMENTS_ARRAY.search(self.text)
+            if match is None:
+                return []
+            self._array_start = match.end() - 1
+            self._pos = match.end()
+
+        segments = []
+        while self._pos < len(self.text) and not self._done:
+            char = self.text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                if self._depth == 0:
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    raw = self.text[self._object_start:self._pos + 1]
+                    self._object_start = None
+                    try:
+                        segments.append(ViralSegment.model_validate(json.loads(raw)))
+                    except (json.JSONDecodeError, ValidationError):
+                        pass
+            elif char == ']' and self._depth == 0:
+                self._done = True
+            self._pos += 1
+        return segments
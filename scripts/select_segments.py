@@ -0,0 +1,157 @@
+import bisect
+import threading
+
+
+def _score(segment):
+    try:
+        return float(segment.get("score", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def clamp_duration(segment, min_seconds, max_seconds, video_end_ms=None):
+    """
+    Returns a copy of the segment stretched or trimmed so that it lasts
+    between min_seconds and max_seconds. Short segments grow at the end and,
+    if they hit the end of the video, at the start.
+    """
+    start = float(segment["start_time"])
+    end = float(segment["end_time"])
+    min_ms = float(min_seconds) * 1000
+    max_ms = float(max_seconds) * 1000
+
+    if end - start > max_ms:
+        end = start + max_ms
+    elif end - start < min_ms:
+        end = start + min_ms
+        if video_end_ms is not None and end > video_end_ms:
+            end = video_end_ms
+            start = max(0.0, end - min_ms)
+
+    return {**segment, "start_time": start, "end_time": end, "duration": round((end - start) / 1000, 3)}
+
+
+def _overlap_ratio(a, b):
+    overlap = min(a["end_time"], b["end_time"]) - max(a["start_time"], b["start_time"])
+    if overlap <= 0:
+        return 0.0
+    shorter = min(a["end_time"] - a["start_time"], b["end_time"] - b["start_time"])
+    return overlap / shorter if shorter > 0 else 1.0
+
+
+def deduplicate(segments, threshold=0.8):
+    """
+    Drops spans that mostly cover a higher-scoring span, which is what
+    neighbouring chunks return when both see the same moment.
+    """
+    kept = []
+    for segment in sorted(segments, key=_score, reverse=True):
+        if all(_overlap_ratio(segment, other) < threshold for other in kept):
+            kept.append(segment)
+    return kept
+
+
+def schedule(segments, k):
+    """
+    Weighted interval scheduling limited to k intervals: returns as many
+    non-overlapping segments as possible, up to k, with the highest total
+    score among such sets. Runs in O(n * k) after sorting by end time.
+    """
+    ordered = sorted(segments, key=lambda s: s["end_time"])
+    n = len(ordered)
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    ends = [s["end_time"] for s in ordered]
+    # previous[i]: number of segments that end no later than segment i starts
+    previous = [bisect.bisect_right(ends, s["start_time"]) for s in ordered]
+    # The bonus outweighs any difference in score, so the count is maximized
+    # (up to k) first and the total score second.
+    bonus = sum(abs(_score(s)) for s in ordered) + 1.0
+    scores = [_score(s) + bonus for s in ordered]
+
+    # best[j][i]: best total using at most j segments among the first i
+    best = [[0.0] * (n + 1) for _ in range(k + 1)]
+    for j in range(1, k + 1):
+        row, prev_row = best[j], best[j - 1]
+        for i in range(1, n + 1):
+            row[i] = max(row[i - 1], prev_row[previous[i - 1]] + scores[i - 1])
+
+    chosen = []
+    i, j = n, k
+    while i > 0 and j > 0:
+        if best[j][i] == best[j][i - 1]:
+            i -= 1
+        else:
+            chosen.append(ordered[i - 1])
+            i, j = previous[i - 1], j - 1
+    return chosen
+
+
+def select_top_segments(segments, k, min_seconds, max_seconds, video_end_ms=None, dedupe_threshold=0.8):
+    """
+    Reduces the segments returned across all chunks to the k non-overlapping
+    ones with the highest total score, clamped to the requested durations and
+    ordered best first. Returns fewer than k only when no more
+    non-overlapping segments exist.
+    """
+    valid = [s for s in segments if s.get("end_time") is not None and s.get("start_time") is not None]
+    clamped = [clamp_duration(s, min_seconds, max_seconds, video_end_ms) for s in valid]
+    unique = deduplicate(clamped, dedupe_threshold)
+    chosen = schedule(unique, int(k))
+    chosen.sort(key=_score, reverse=True)
+
+    print(f"Selected {len(chosen)} of {len(segments)} segments ({len(clamped) - len(unique)} near-duplicates dropped)")
+    if len(chosen) < int(k):
+        print(f"Warning: only {len(chosen)} non-overlapping segments available for {k} requested clips")
+    return chosen
+
+
+def top_up(chosen, candidates, k, min_seconds, max_seconds, video_end_ms=None):
+    """
+    Adds the best candidates that fit around the already chosen segments
+    until k are chosen. Used when a ranking step returned too few picks.
+    """
+    if len(chosen) >= int(k):
+        return chosen
+    clamped = [clamp_duration(s, min_seconds, max_seconds, video_end_ms) for s in candidates
+               if s.get("end_time") is not None and s.get("start_time") is not None]
+    free = [s for s in clamped if all(_overlap_ratio(s, other) == 0 for other in chosen)]
+    extra = schedule(deduplicate(free), int(k) - len(chosen))
+    return chosen + sorted(extra, key=_score, reverse=True)
+
+
+class StreamingSelector:
+    """
+    Online counterpart of select_top_segments for segments that arrive one
+    at a time. Each segment is clamped and accepted greedily if it does not
+    overlap an accepted one, until k are accepted. Accepted segments keep
+    their index, so work already started on them stays valid; the price is
+    that a later, better segment cannot displace an earlier one.
+    """
+
+    def __init__(self, k, min_seconds, max_seconds, video_end_ms=None):
+        self.k = int(k)
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.video_end_ms = video_end_ms
+        self.accepted = []
+        self._lock = threading.Lock()
+
+    @property
+    def full(self):
+        return len(self.accepted) >= self.k
+
+    def offer(self, segment):
+        """Returns (index, clamped segment) if accepted, otherwise None."""
+        if segment.get("end_time") is None or segment.get("start_time") is None:
+            return None
+        clamped = clamp_duration(segment, self.min_seconds, self.max_seconds, self.video_end_ms)
+        with self._lock:
+            if self.full:
+                return None
+            if any(_overlap_ratio(clamped, other) > 0 for other in self.accepted):
+                return None
+            self.accepted.append(clamped)
+            return len(self.accepted) - 1, clamped
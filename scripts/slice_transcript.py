@@ -0,0 +1,91 @@
+import os
+import json
+
+
+def clip_bounds(segment):
+    # Mirrors the seek performed by cut_segments so the subtitles line up
+    # with the first frame of the cut.
+    start = int(segment["start_time"]) / 1000
+    duration = (segment["end_time"] - segment["start_time"]) / 1000
+    return start, start + duration
+
+
+def slice_words(words, clip_start, clip_end):
+    """
+    Returns the words that start inside [clip_start, clip_end) rebased to the
+    clip. Words without timings (e.g. numerals whisperx could not align)
+    follow the fate of the closest preceding timed word.
+    """
+    sliced = []
+    keep = None
+    for word in words:
+        if 'start' in word and 'end' in word:
+            keep = clip_start <= word['start'] < clip_end
+            if keep:
+                sliced.append({
+                    **word,
+                    'start': round(max(0.0, word['start'] - clip_start), 3),
+                    'end': round(min(word['end'], clip_end) - clip_start, 3),
+                })
+        elif keep:
+            sliced.append(dict(word))
+    return sliced
+
+
+def slice_segments(segments, clip_start, clip_end):
+    """
+    Cuts a word-aligned transcript down to [clip_start, clip_end), splitting
+    segments that straddle either boundary and rebasing timestamps to zero.
+    """
+    sliced_segments = []
+    for seg in segments:
+        if seg.get('end', 0) <= clip_start or seg.get('start', 0) >= clip_end:
+            continue
+
+        words = slice_words(seg.get('words', []), clip_start, clip_end)
+        timed = [w for w in words if 'start' in w]
+        if not timed:
+            continue
+
+        sliced_segments.append({
+            'start': timed[0]['start'],
+            'end': timed[-1]['end'],
+            'text': " ".join(w['word'].strip() for w in words if w.get('word')),
+            'words': words,
+        })
+    return sliced_segments
+
+
+def slice_transcript(viral_segments, transcript_path='tmp/input_video.json', output_folder='subs', first_index=0):
+    """
+    Builds the per-clip subtitle JSON for every viral segment from the
+    already aligned transcript of the full video, replacing a second ASR pass
+    over the cut files. first_index numbers the outputs when only some of
+    the segments are passed.
+    """
+    try:
+        with open(transcript_path, 'r', encoding='utf-8') as f:
+            transcript = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"Error reading transcript {transcript_path}: {e}")
+        return
+
+    os.makedirs(output_folder, exist_ok=True)
+    segments = transcript.get('segments', [])
+
+    for i, viral_segment in enumerate(viral_segments, start=first_index):
+        output_path = os.path.join(output_folder, f"output{str(i).zfill(3)}_original_scale.json")
+        if os.path.exists(output_path):
+            continue
+
+        clip_start, clip_end = clip_bounds(viral_segment)
+        clip_segments = slice_segments(segments, clip_start, clip_end)
+        result = {
+            'segments': clip_segments,
+            'word_segments': [w for seg in clip_segments for w in seg['words']],
+            'language': transcript.get('language'),
+        }
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"Sliced subtitles for segment {i}: {len(clip_segments)} lines")
@@ -0,0 +1,32 @@
+import time
+import contextlib
+from collections import OrderedDict
+
+
+class StageTimer:
+    """
+    Collects wall-clock time and call counts per pipeline stage so a job can
+    log how often, and for how long, each step actually ran.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.stages = OrderedDict()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            count, total = self.stages.get(name, (0, 0.0))
+            self.stages[name] = (count + 1, total + elapsed)
+            print(f"[timing:{self.label}] {name} finished in {elapsed:.2f}s")
+
+    def report(self):
+        total = sum(seconds for _, seconds in self.stages.values())
+        print(f"[timing:{self.label}] total {total:.2f}s")
+        for name, (count, seconds) in self.stages.items():
+            print(f"[timing:{self.label}]   {name}: {count} pass(es), {seconds:.2f}s")
+        return {name: {"passes": count, "seconds": round(seconds, 3)} for name, (count, seconds) in self.stages.items()}
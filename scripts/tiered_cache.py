@@ -0,0 +1,129 @@
+import os
+import gzip
+import json
+import time
+import threading
+from firebase_admin import storage
+
+
+class TieredCache:
+    """
+    Two-tier cache of JSON documents: a local on-disk tier in front of the
+    storage bucket. Entries are gzip-compressed and wrapped in an envelope
+    carrying a format version and creation time; entries with another
+    version or older than max_age_seconds are treated as misses and deleted.
+    The local tier is additionally trimmed, least recently used first, to
+    max_local_mb.
+    """
+
+    def __init__(self, name, local_dir, version, max_age_seconds, max_local_mb):
+        self.name = name
+        self.local_dir = os.path.join(local_dir, name)
+        self.version = version
+        self.max_age_seconds = max_age_seconds
+        self.max_local_mb = max_local_mb
+        self._lock = threading.Lock()
+
+    def _local_path(self, key):
+        return os.path.join(self.local_dir, f"{key}.json.gz")
+
+    def _blob_path(self, key, bucket_prefix):
+        return f"{bucket_prefix.strip('/')}/{key}.json.gz"
+
+    def _encode(self, payload):
+        envelope = {"version": self.version, "created_at": time.time(), "payload": payload}
+        return gzip.compress(json.dumps(envelope, ensure_ascii=False).encode("utf-8"))
+
+    def _decode(self, data):
+        envelope = json.loads(gzip.decompress(data).decode("utf-8"))
+        if envelope.get("version") != self.version:
+            return None
+        if time.time() - envelope.get("created_at", 0) > self.max_age_seconds:
+            return None
+        return envelope.get("payload")
+
+    def get(self, key, bucket_prefix=None):
+        local_path = self._local_path(key)
+        if os.path.exists(local_path):
+            try:
+                with open(local_path, "rb") as f:
+                    payload = self._decode(f.read())
+                if payload is not None:
+                    os.utime(local_path)
+                    print(f"[cache:{self.name}] local hit {key}")
+                    return payload
+                os.remove(local_path)
+            except (OSError, ValueError) as e:
+                print(f"[cache:{self.name}] Error reading {local_path}: {e}")
+
+        if bucket_prefix:
+            try:
+                blob = storage.bucket().blob(self._blob_path(key, bucket_prefix))
+                if blob.exists():
+                    data = blob.download_as_bytes()
+                    payload = self._decode(data)
+                    if payload is not None:
+                        print(f"[cache:{self.name}] bucket hit {key}")
+                        self._write_local(key, data)
+                        return payload
+                    blob.delete()
+            except Exception as e:
+                print(f"[cache:{self.name}] Error reading bucket entry {key}: {e}")
+
+        print(f"[cache:{self.name}] miss {key}")
+        return None
+
+    def put(self, key, payload, bucket_prefix=None):
+        data = self._encode(payload)
+        self._write_local(key, data)
+
+        if bucket_prefix:
+            try:
+                blob = storage.bucket().blob(self._blob_path(key, bucket_prefix))
+                blob.upload_from_string(data, content_type="application/gzip")
+            except Exception as e:
+                print(f"[cache:{self.name}] Error writing bucket entry {key}: {e}")
+
+    def _write_local(self, key, data):
+        try:
+            os.makedirs(self.local_dir, exist_ok=True)
+            local_path = self._local_path(key)
+            tmp_path = f"{local_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, local_path)
+        except OSError as e:
+            print(f"[cache:{self.name}] Error writing {key}: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            try:
+                names = [n for n in os.listdir(self.local_dir) if n.endswith(".json.gz")]
+            except FileNotFoundError:
+                return
+
+            now = time.time()
+            entries = []
+            for name in names:
+                path = os.path.join(self.local_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if now - stat.st_mtime > self.max_age_seconds:
+                    os.remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            budget = self.max_local_mb * 1024 * 1024
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= budget:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
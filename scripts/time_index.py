@@ -0,0 +1,195 @@
+import os
+import subprocess
+import numpy as np
+from scripts.prerank import load_words
+from scripts.cut_segments import stream_copy_enabled
+from scripts.transcript_format import load_transcript_lines, merge_sentences
+
+
+def probe_start_time(video_path):
+    """The container start_time in seconds, which ffmpeg's -ss counts from."""
+    command = ["ffprobe", "-v", "error", "-show_entries", "format=start_time", "-of", "csv=p=0", video_path]
+    try:
+        result = subprocess.run(command, check=True, capture_output=True, text=True)
+        return float(result.stdout.strip() or 0)
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return 0.0
+
+
+def probe_keyframes(video_path):
+    """
+    Returns the sorted keyframe times of the first video stream, in seconds
+    from the container start as ffmpeg's -ss counts them, read from the
+    packet flags so nothing is decoded. The result is cached next to the
+    video as <name>.keyframes.npy.
+    """
+    cache_path = os.path.splitext(video_path)[0] + ".keyframes.npy"
+    try:
+        if os.path.getmtime(cache_path) >= os.path.getmtime(video_path):
+            return np.load(cache_path)
+    except OSError:
+        pass
+
+    command = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path
+    ]
+    try:
+        result = subprocess.run(command, check=True, capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Could not read keyframes of {video_path}: {e}")
+        return np.zeros(0)
+
+    times = []
+    for row in result.stdout.splitlines():
+        pts, _, flags = row.partition(",")
+        if "K" in flags:
+            try:
+                times.append(float(pts))
+            except ValueError:
+                continue
+    # Packet timestamps include the container start_time (edit lists,
+    # B-frame delay), which -ss does not.
+    keyframes = np.unique(np.array(times, dtype=np.float64)) - probe_start_time(video_path)
+    try:
+        np.save(cache_path, keyframes)
+    except OSError:
+        pass
+    return keyframes
+
+
+def nearest(values, t, tolerance):
+    """Closest value to t in the sorted array, or None if none is within tolerance."""
+    i = int(np.searchsorted(values, t))
+    best = None
+    for j in (i - 1, i):
+        if 0 <= j < len(values) and abs(values[j] - t) <= tolerance:
+            if best is None or abs(values[j] - t) < abs(best - t):
+                best = float(values[j])
+    return best
+
+
+def at_or_before(values, t, tolerance):
+    """Latest value not after t, or None if it is more than tolerance before t."""
+    i = int(np.searchsorted(values, t, side="right")) - 1
+    if i >= 0 and t - values[i] <= tolerance:
+        return float(values[i])
+    return None
+
+
+class TranscriptTimeIndex:
+    """
+    Sorted arrays of word starts and ends, sentence starts and ends and
+    source keyframes (all in seconds), answering nearest-boundary queries
+    with a binary search. Keyframes are only loaded when the stream-copy cut
+    will run, since that is the only thing a keyframe start buys.
+    """
+
+    def __init__(self, word_starts, word_ends, sentence_starts, sentence_ends, keyframes=None):
+        self.word_starts = np.sort(np.asarray(word_starts, dtype=np.float64))
+        self.word_ends = np.sort(np.asarray(word_ends, dtype=np.float64))
+        self.sentence_starts = np.sort(np.asarray(sentence_starts, dtype=np.float64))
+        self.sentence_ends = np.sort(np.asarray(sentence_ends, dtype=np.float64))
+        self.keyframes = np.sort(np.asarray(keyframes if keyframes is not None else [], dtype=np.float64))
+
+    @classmethod
+    def from_files(cls, transcript_path='tmp/input_video.json', video_path='tmp/input_video.mp4', keyframes=None):
+        if keyframes is None:
+            keyframes = stream_copy_enabled()
+        word_starts, word_ends, _ = load_words(transcript_path)
+        sentences = merge_sentences(load_transcript_lines(transcript_path))
+        if not len(word_starts) and not sentences:
+            return None
+        return cls(
+            word_starts,
+            word_ends,
+            [start for start, _, _ in sentences],
+            [end for _, end, _ in sentences],
+            probe_keyframes(video_path) if keyframes and os.path.exists(video_path) else None,
+        )
+
+    def snap_start(self, t, sentence_tolerance, word_tolerance):
+        snapped = nearest(self.sentence_starts, t, sentence_tolerance)
+        if snapped is None:
+            snapped = nearest(self.word_starts, t, word_tolerance)
+        return t if snapped is None else snapped
+
+    def snap_end(self, t, sentence_tolerance, word_tolerance):
+        snapped = nearest(self.sentence_ends, t, sentence_tolerance)
+        if snapped is None:
+            snapped = nearest(self.word_ends, t, word_tolerance)
+        return t if snapped is None else snapped
+
+    def keyframe_before(self, t, tolerance):
+        return at_or_before(self.keyframes, t, tolerance)
+
+    def snap_segment(self, segment, min_seconds, max_seconds, sentence_tolerance=None, word_tolerance=None,
+                     keyframe_tolerance=None):
+        """
+        Returns a copy of the segment with its start moved to the nearest
+        sentence start (else word start) and its end to the nearest sentence
+        end (else word end). When the index has keyframes, the start is then
+        pulled back to one that is close enough, which marks the segment
+        keyframe_aligned for a stream-copy cut. Moves that would break the
+        duration limits are dropped.
+        """
+        if sentence_tolerance is None:
+            sentence_tolerance = float(os.getenv('SNAP_SENTENCE_TOLERANCE_SECONDS', '2.0'))
+        if word_tolerance is None:
+            word_tolerance = float(os.getenv('SNAP_WORD_TOLERANCE_SECONDS', '0.75'))
+        if keyframe_tolerance is None:
+            keyframe_tolerance = float(os.getenv('SNAP_KEYFRAME_TOLERANCE_SECONDS', '1.5'))
+
+        start = float(segment["start_time"]) / 1000
+        end = float(segment["end_time"]) / 1000
+        snapped_start = self.snap_start(start, sentence_tolerance, word_tolerance)
+        keyframe = self.keyframe_before(snapped_start, keyframe_tolerance)
+        if keyframe is not None:
+            snapped_start = keyframe
+        snapped_end = self.snap_end(end, sentence_tolerance, word_tolerance)
+
+        def fits(a, b):
+            return float(min_seconds) <= b - a <= float(max_seconds)
+
+        for new_start, new_end in ((snapped_start, snapped_end), (snapped_start, end), (start, snapped_end)):
+            if fits(new_start, new_end):
+                start, end = new_start, new_end
+                break
+
+        return {
+            **segment,
+            "start_time": start * 1000,
+            "end_time": end * 1000,
+            "duration": round(end - start, 3),
+            "keyframe_aligned": keyframe is not None and start == keyframe,
+        }
+
+
+def _overlaps(segment, others):
+    return any(segment["start_time"] < o["end_time"] and segment["end_time"] > o["start_time"] for o in others)
+
+
+def snap_index():
+    """The time index of the current video, or None when SEGMENT_SNAP_ENABLED is false or there is no transcript."""
+    if os.getenv('SEGMENT_SNAP_ENABLED', 'true').lower() != 'true':
+        return None
+    return TranscriptTimeIndex.from_files()
+
+
+def snap_segments(segments, min_seconds, max_seconds, index=None):
+    """
+    Snaps every segment with snap_segment, keeping the unsnapped segment
+    wherever snapping would make it overlap another one. Segments are
+    returned unchanged when there is no index.
+    """
+    index = index or snap_index()
+    if index is None:
+        return segments
+
+    placed = []
+    for i, segment in enumerate(segments):
+        snapped = index.snap_segment(segment, min_seconds, max_seconds)
+        placed.append(segment if _overlaps(snapped, placed + segments[i + 1:]) else snapped)
+    aligned = sum(1 for s in placed if s.get("keyframe_aligned"))
+    print(f"Snapped {len(placed)} segments to sentence boundaries, {aligned} start on a keyframe")
+    return placed
@@ -1,11 +1,11 @@
 import os
 import sys
 import glob
-from scripts.whisper_gen import load_transcription_model, transcribe_with_model, unload_model
+from scripts.whisper_gen import transcription_model, transcribe_files_with_model, transcribe_segments_with_model
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-def transcribe(input_folder='tmp', output_folder='subs'):
+def transcribe(input_folder='tmp', output_folder='subs', model_name=None):
     if not os.path.exists(input_folder):
         print(f"Input folder {input_folder} does not exist.")
         return
@@ -15,11 +15,15 @@ def transcribe(input_folder='tmp', output_folder='subs'):
         print("No files found to transcribe.")
         return
 
-    model_name = os.getenv('WHISPER_MODEL_NAME', 'tiny')
-    model, device = load_transcription_model(model_name)
-    
-    try:
-        for input_file in files:
-            transcribe_with_model(model, device, input_file, output_folder)
-    finally:
-        unload_model(model)
\ No newline at end of file
+    model_name = model_name or os.getenv('WHISPER_MODEL_NAME', 'tiny')
+    with transcription_model(model_name) as (model, device):
+        transcribe_files_with_model(model, device, sorted(files), output_folder)
+
+def transcribe_segments(segments, source_file='tmp/input_video.mp4', output_folder='subs', model_name=None, first_index=0):
+    if not segments:
+        print("No segments to transcribe.")
+        return
+
+    model_name = model_name or os.getenv('WHISPER_MODEL_NAME', 'tiny')
+    with transcription_model(model_name) as (model, device):
+        transcribe_segments_with_model(model, device, source_file, segments, output_folder, first_index=first_index)
\ No newline at end of file
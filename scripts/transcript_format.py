@@ -0,0 +1,104 @@
+import csv
+import json
+import math
+import re
+
+SENTENCE_END = re.compile(r'[.!?…。！？]["\')\]]*$')
+
+
+def load_transcript_lines(json_path='tmp/input_video.json', tsv_path='tmp/input_video.tsv'):
+    """
+    Returns the transcript as (start_seconds, end_seconds, text) tuples, read
+    from the aligned JSON when available and from the TSV otherwise.
+    """
+    lines = []
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            for seg in json.load(f).get('segments', []):
+                text = (seg.get('text') or '').strip()
+                if text and seg.get('start') is not None and seg.get('end') is not None:
+                    lines.append((float(seg['start']), float(seg['end']), text))
+        return lines
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+
+    with open(tsv_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        next(reader, None)
+        for row in reader:
+            if len(row) < 3 or not row[2].strip():
+                continue
+            try:
+                lines.append((float(row[0]), float(row[1]), row[2].strip()))
+            except ValueError:
+                continue
+    return lines
+
+
+def merge_sentences(lines, max_span_seconds=30.0, max_gap_seconds=1.5):
+    """
+    Merges consecutive lines into sentence-level spans. A span is closed at
+    sentence-ending punctuation, before a pause longer than max_gap_seconds,
+    or once it reaches max_span_seconds.
+    """
+    spans = []
+    current = None
+    for start, end, text in lines:
+        if current is not None and start - current[1] > max_gap_seconds:
+            spans.append(current)
+            current = None
+
+        if current is None:
+            current = [start, end, text]
+        else:
+            current[1] = end
+            current[2] = f"{current[2]} {text}"
+
+        if SENTENCE_END.search(text) or current[1] - current[0] >= max_span_seconds:
+            spans.append(current)
+            current = None
+
+    if current is not None:
+        spans.append(current)
+    return [tuple(span) for span in spans]
+
+
+def compact_transcript(lines, resolution_ms=1000, merge=True):
+    """
+    Serializes the transcript for the prompt as one "start-end text" line per
+    span, with integer timestamps in units of resolution_ms and whitespace
+    collapsed.
+    """
+    if merge:
+        lines = merge_sentences(lines)
+    out = []
+    for start, end, text in lines:
+        text = " ".join(text.split())
+        out.append(f"{int(start * 1000 // resolution_ms)}-{int(math.ceil(end * 1000 / resolution_ms))} {text}")
+    return "\n".join(out)
+
+
+def time_unit_description(resolution_ms):
+    if resolution_ms == 1000:
+        return "seconds"
+    if resolution_ms == 1:
+        return "milliseconds"
+    return f"units of {resolution_ms} milliseconds"
+
+
+def estimate_tokens(text):
+    # Gemini averages roughly four characters per token on transcript text.
+    return int(math.ceil(len(text) / 4))
+
+
+def count_tokens(client, text, model):
+    """
+    Exact token count from the API when a client is given, otherwise the
+    character-based estimate.
+    """
+    if client is not None:
+        try:
+            return client.models.count_tokens(model=model, contents=text).total_tokens
+        except Exception as e:
+            print(f"Token counting failed, using estimate: {e}")
+    return estimate_tokens(text)
@@ -0,0 +1,118 @@
+import os
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from scripts.prerank import merge_spans
+from scripts.transcript_format import merge_sentences
+
+TOKEN = re.compile(r'\w+')
+
+# Function words plus the words people use to phrase a targeting request
+# ("only the parts about ...", "apenas os trechos sobre ..."), which would
+# otherwise match half the transcript.
+STOPWORDS = frozenset("""
+a an the and or but of to in on at for with from by about into over as is are was were be been it its this that these
+those there their they them we you your i me my our he she his her what which who when where how all any some only just
+more most very so than then also not no do does did can could should would will make show find give want get keep
+part parts segment segments clip clips moment moments video videos section sections talk talks talking
+o os as um uma uns umas e ou de do da dos das em no na nos nas por para com sem sobre que se ao aos isso isto esse essa
+este esta eles elas ele ela eu voce voces nos meu minha seu sua mais muito so apenas somente quando onde como qual
+parte partes trecho trechos corte cortes momento momentos video videos fala falam falando mostre mostrar quero
+""".split())
+
+
+def _fold(text):
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+
+
+def tokenize(text):
+    """Lower-cased, accent-folded word tokens without stopwords, with plurals folded."""
+    tokens = []
+    for token in TOKEN.findall(_fold(text)):
+        if token in STOPWORDS or token.isdigit():
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a list of documents, kept as an inverted index of
+    term -> [(document, term frequency)], so a query only touches the
+    postings of its own terms.
+    """
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for doc_id, text in enumerate(documents):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self.postings[term].append((doc_id, frequency))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def idf(self, term):
+        n = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.lengths) - n + 0.5) / (n + 0.5))
+
+    def scores(self, query):
+        """Returns {document: score} for the documents matching any query term."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / (self.average_length or 1.0))
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+    def search(self, query, limit=None):
+        """Best-scoring (document, score) pairs, best first."""
+        ranked = sorted(self.scores(query).items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+
+def relevant_spans(instructions, lines, num_segments, window_seconds, hits=None, context_seconds=None,
+                   min_relative_score=None):
+    """
+    Finds the transcript sentences most relevant to the custom instructions
+    and returns them padded with enough context for a full clip and merged,
+    as (start, end) seconds. Returns None when the instructions match
+    nothing specific or the matches would cover most of the video anyway,
+    so the caller falls back to the whole transcript.
+    """
+    if not instructions or not lines or not tokenize(instructions):
+        return None
+
+    sentences = merge_sentences(lines)
+    index = BM25Index([text for _, _, text in sentences])
+    hits = hits or int(os.getenv('TARGETED_SEARCH_HITS_PER_SEGMENT', '5')) * max(1, int(num_segments))
+    if context_seconds is None:
+        context_seconds = float(os.getenv('TARGETED_SEARCH_CONTEXT_SECONDS', str(window_seconds)))
+    if min_relative_score is None:
+        min_relative_score = float(os.getenv('TARGETED_SEARCH_MIN_RELATIVE_SCORE', '0.3'))
+
+    ranked = index.search(instructions, hits)
+    if not ranked:
+        return None
+    cutoff = ranked[0][1] * min_relative_score
+    matched = sorted((sentences[doc_id][0], sentences[doc_id][1]) for doc_id, score in ranked if score >= cutoff)
+
+    duration = max(end for _, end, _ in lines)
+    spans = merge_spans(matched, context_seconds, duration)
+    covered = sum(end - start for start, end in spans)
+    if covered >= duration * float(os.getenv('TARGETED_SEARCH_MAX_COVERAGE', '0.8')):
+        return None
+    print(f"Targeted search kept {len(spans)} spans ({len(matched)} matching sentences) covering {covered:.0f}s of {duration:.0f}s")
+    return spans
@@ -3,47 +3,67 @@ import os
 import csv
 import json
 import gc 
+import time
+import hashlib
+import subprocess
+import contextlib
+import numpy as np
 import torch
+from whisperx.audio import SAMPLE_RATE
+from importlib.metadata import version, PackageNotFoundError
+from scripts.model_registry import ModelRegistry
+from scripts.tiered_cache import TieredCache
+from scripts.audio_extract import extracted_path, extract_audio, remove_extracted, load_shared_audio, audio_slice
+from scripts.slice_transcript import clip_bounds
+from scripts.batched_asr import transcribe_batch, transcribe_chunks, vad_chunks, log_throughput
 
 torch.backends.cuda.matmul.allow_tf32 = True
 torch.backends.cudnn.allow_tf32 = True
 
-def load_transcription_model(model_name='large-v3-turbo', compute_type='int8'):
+# Approximate resident size of the float16 ctranslate2 weights, in MB.
+MODEL_SIZE_MB = {
+    'tiny': 75,
+    'base': 145,
+    'small': 485,
+    'medium': 1530,
+    'large-v2': 3090,
+    'large-v3': 3090,
+    'large-v3-turbo': 1620,
+    'distil-large-v3': 1510,
+}
+
+def load_transcription_model(model_name='large-v3-turbo', compute_type='int8', threads=None):
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"Loading WhisperX model {model_name} on {device}...")
     vad_options = {
         "vad_onset": 0.4,
         "vad_offset": 0.3
     }
+    extra_options = {}
+    if threads:
+        extra_options["threads"] = threads
     model = whisperx.load_model(
         model_name, 
         device=device,
         compute_type=compute_type,
-        vad_options=vad_options
+        vad_options=vad_options,
+        **extra_options
     )
     return model, device
 
-def transcribe_with_model(model, device, input_file, output_folder):
+def output_paths(input_file, output_folder):
     base_name = os.path.splitext(os.path.basename(input_file))[0]
-    json_output_path = os.path.join(output_folder, f"{base_name}.json")
-    
-    if os.path.exists(json_output_path):
-        print(f"Skipping: {json_output_path} already exists.")
-        return
+    return (
+        os.path.join(output_folder, f"{base_name}.json"),
+        os.path.join(output_folder, f"{base_name}.tsv"),
+    )
 
-    os.makedirs(output_folder, exist_ok=True)
-    print(f"Transcribing {input_file}...")
-    
-    try:
-        audio = whisperx.load_audio(input_file)
-        result = model.transcribe(audio, batch_size=4)
-        
-        print("Aligning...")
-        model_a, metadata = whisperx.load_align_model(
-            language_code=result["language"], 
-            device=device
-        )
-        
+def align_and_save(result, audio, device, input_file, output_folder):
+    json_output_path, tsv_output_path = output_paths(input_file, output_folder)
+
+    print("Aligning...")
+    language = result["language"]
+    with alignment_model(language, device) as (model_a, metadata):
         result = whisperx.align(
             result["segments"], 
             model_a, 
@@ -52,21 +72,244 @@ def transcribe_with_model(model, device, input_file, output_folder):
             device=device, 
             return_char_alignments=False
         )
+    result["language"] = language
 
-        del model_a
-        gc.collect()
+    print(f"Saving to {json_output_path}...")
+    with open(json_output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+        
+    save_as_tsv(result["segments"], tsv_output_path)
+    return result
+
+def transcribe_with_model(model, device, input_file, output_folder):
+    json_output_path, _ = output_paths(input_file, output_folder)
+    
+    if os.path.exists(json_output_path):
+        print(f"Skipping: {json_output_path} already exists.")
+        return
+
+    os.makedirs(output_folder, exist_ok=True)
+    print(f"Transcribing {input_file}...")
+    
+    try:
+        audio = load_shared_audio(input_file)
+        started = time.perf_counter()
+        result = model.transcribe(audio, batch_size=4)
+        log_throughput("per-file", len(audio) / SAMPLE_RATE, time.perf_counter() - started)
 
-        print(f"Saving to {json_output_path}...")
-        with open(json_output_path, "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
-            
-        tsv_output_path = os.path.join(output_folder, f"{base_name}.tsv")
-        save_as_tsv(result["segments"], tsv_output_path)
+        align_and_save(result, audio, device, input_file, output_folder)
 
     except Exception as e:
         print(f"Error processing {input_file}: {e}")
         raise
 
+def _pending(names, output_folder):
+    pending = []
+    for name in names:
+        json_output_path, _ = output_paths(name, output_folder)
+        if os.path.exists(json_output_path):
+            print(f"Skipping: {json_output_path} already exists.")
+        else:
+            pending.append(name)
+    return pending
+
+def transcribe_audio_items(model, device, items, output_folder, batch_size=None, release_audio=False):
+    """
+    Transcribes (name, audio) pairs through the batched engine so their VAD
+    chunks share decoder batches, then aligns and saves each one exactly like
+    transcribe_with_model. Audio is flushed to the engine in groups of at most
+    WHISPER_BATCH_MAX_AUDIO_SECONDS to bound memory. With release_audio, names
+    are input files whose extracted PCM is deleted once their transcript is
+    written.
+    """
+    batch_size = batch_size or int(os.getenv('WHISPER_BATCH_SIZE', '16'))
+    max_group_seconds = float(os.getenv('WHISPER_BATCH_MAX_AUDIO_SECONDS', '3600'))
+
+    os.makedirs(output_folder, exist_ok=True)
+
+    group = []
+    group_seconds = 0.0
+    for name, audio in items:
+        group.append((name, audio))
+        group_seconds += len(audio) / SAMPLE_RATE
+        if group_seconds >= max_group_seconds:
+            _transcribe_group(model, device, group, output_folder, batch_size, release_audio)
+            group = []
+            group_seconds = 0.0
+
+    if group:
+        _transcribe_group(model, device, group, output_folder, batch_size, release_audio)
+
+def transcribe_files_with_model(model, device, input_files, output_folder, batch_size=None, release_audio=False):
+    pending = _pending(input_files, output_folder)
+    items = ((input_file, load_shared_audio(input_file)) for input_file in pending)
+    transcribe_audio_items(model, device, items, output_folder, batch_size, release_audio)
+
+def transcribe_segments_with_model(model, device, source_file, segments, output_folder, batch_size=None, first_index=0):
+    """
+    Transcribes the viral segments of source_file straight from zero-copy
+    slices of its shared audio buffer, writing the same
+    output###_original_scale.json files a transcription of the cuts would.
+    """
+    names = [f"output{str(i).zfill(3)}_original_scale" for i in range(first_index, first_index + len(segments))]
+    pending = set(_pending(names, output_folder))
+    audio = load_shared_audio(source_file)
+
+    items = []
+    for name, segment in zip(names, segments):
+        if name in pending:
+            clip_start, clip_end = clip_bounds(segment)
+            items.append((name, audio_slice(audio, clip_start, clip_end)))
+    transcribe_audio_items(model, device, items, output_folder, batch_size)
+
+def _transcribe_group(model, device, group, output_folder, batch_size, release_audio=False):
+    print(f"Transcribing {len(group)} files in shared batches...")
+    results = transcribe_batch(model, [audio for _, audio in group], batch_size=batch_size)
+    for (name, audio), result in zip(group, results):
+        try:
+            align_and_save(result, audio, device, name, output_folder)
+        except Exception as e:
+            print(f"Error processing {name}: {e}")
+        if release_audio:
+            remove_extracted(name)
+
+def probe_duration(input_file):
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        input_file
+    ]
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        return float(process.stdout)
+    except (ValueError, TypeError):
+        return None
+
+def load_audio_window(input_file, start, duration, sr=SAMPLE_RATE):
+    """
+    Decodes only [start, start + duration) seconds of the input to mono
+    float32 PCM, the same format whisperx.load_audio returns for the whole file.
+    """
+    cmd = [
+        "ffmpeg", "-nostdin",
+        "-threads", "0",
+        "-ss", str(start),
+        "-t", str(duration),
+        "-i", input_file,
+        "-f", "s16le",
+        "-ac", "1",
+        "-acodec", "pcm_s16le",
+        "-ar", str(sr),
+        "-"
+    ]
+    out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    return np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
+
+def shift_segment(segment, offset):
+    """Copy of a whisperx segment with its and its words' timestamps moved by offset seconds."""
+    shifted = {**segment}
+    for key in ('start', 'end'):
+        if key in shifted:
+            shifted[key] = round(shifted[key] + offset, 3)
+    words = []
+    for word in segment.get('words', []):
+        word = {**word}
+        for key in ('start', 'end'):
+            if key in word:
+                word[key] = round(word[key] + offset, 3)
+        words.append(word)
+    if 'words' in segment:
+        shifted['words'] = words
+    return shifted
+
+def transcribe_streaming(model, device, input_file, output_folder, window_seconds=300, lookahead_seconds=30, batch_size=4, duration=None):
+    """
+    Transcribes a long input window by window so peak memory does not grow
+    with its length. Each window is decoded on its own, cut at the last VAD
+    chunk that starts inside it, transcribed and aligned, and its segments are
+    appended to the JSON/TSV outputs before the next window is decoded.
+    Pass duration when it is already known to skip probing the input again.
+    """
+    json_output_path, tsv_output_path = output_paths(input_file, output_folder)
+
+    if os.path.exists(json_output_path):
+        print(f"Skipping: {json_output_path} already exists.")
+        return
+
+    if duration is None:
+        duration = probe_duration(input_file)
+    if duration is None:
+        raise ValueError(f"Could not determine duration of {input_file}")
+
+    os.makedirs(output_folder, exist_ok=True)
+    print(f"Transcribing {input_file} in {window_seconds}s windows...")
+
+    partial_path = json_output_path + ".partial"
+    started = time.perf_counter()
+    language = None
+    offset = 0.0
+    first = True
+
+    with open(partial_path, "w", encoding="utf-8") as jf, open(tsv_output_path, 'w', newline='', encoding='utf-8') as tf:
+        writer = csv.writer(tf, delimiter='\t')
+        writer.writerow(["start", "end", "text"])
+        jf.write('{"segments": [\n')
+
+        while offset < duration:
+            audio = load_audio_window(input_file, offset, window_seconds + lookahead_seconds)
+            window_length = len(audio) / SAMPLE_RATE
+            if window_length == 0:
+                break
+
+            chunks = vad_chunks(model, audio)
+            if offset + window_length >= duration - 0.01:
+                keep = chunks
+                cut = window_length
+            else:
+                # VAD chunks are at most 30s long, so any chunk starting inside
+                # the window also ends inside the lookahead and the cut lands in
+                # silence after it.
+                keep = [c for c in chunks if c['start'] < window_seconds]
+                cut = max([window_seconds] + [c['end'] for c in keep])
+
+            if language is None:
+                language = model.preset_language or model.detect_language(audio)
+
+            if keep:
+                segments = transcribe_chunks(model, audio, keep, language, batch_size)
+                with alignment_model(language, device) as (model_a, metadata):
+                    aligned = whisperx.align(
+                        segments,
+                        model_a,
+                        metadata,
+                        audio,
+                        device=device,
+                        return_char_alignments=False
+                    )
+
+                for segment in aligned["segments"]:
+                    segment = shift_segment(segment, offset)
+                    if not first:
+                        jf.write(",\n")
+                    jf.write(json.dumps(segment, ensure_ascii=False))
+                    first = False
+                    text = (segment.get('text') or '').strip()
+                    if text:
+                        writer.writerow([segment.get('start'), segment.get('end'), text])
+                jf.flush()
+                tf.flush()
+
+            print(f"Window {offset:.1f}s-{offset + cut:.1f}s done ({len(keep)} chunks)")
+            offset += cut
+            del audio
+
+        jf.write('\n], "language": ' + json.dumps(language) + '}\n')
+
+    os.replace(partial_path, json_output_path)
+    log_throughput("streaming", duration, time.perf_counter() - started)
+
 def unload_model(model):
     if model:
         del model
@@ -74,13 +317,268 @@ def unload_model(model):
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
 
-def generate_whisperx(input_file, output_folder, compute_type='int8'):
-    model_name = os.getenv('WHISPER_MODEL_NAME', 'tiny')
-    model, device = load_transcription_model(model_name, compute_type)
+def estimate_model_size_mb(model_name, compute_type='int8'):
+    size = MODEL_SIZE_MB.get(model_name, MODEL_SIZE_MB['large-v3'])
+    if compute_type.startswith('int8'):
+        return size // 2
+    if compute_type == 'float32':
+        return size * 2
+    return size
+
+# whisperx pipelines keep per-call state (the tokenizer) on the instance, so
+# requests sharing a model take turns on it.
+_transcription_models = ModelRegistry(
+    name="transcription",
+    budget_mb=int(os.getenv('WHISPER_MODEL_CACHE_MB', '4096')),
+    on_evict=unload_model,
+    exclusive=True,
+)
+
+@contextlib.contextmanager
+def transcription_model(model_name='large-v3-turbo', compute_type='int8'):
+    """
+    Leases a warm transcription model from the process-wide registry,
+    loading it on first use. Yields (model, device); the model is held
+    exclusively until the block exits.
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    key = (model_name, compute_type, device)
+    with _transcription_models.lease(
+        key,
+        lambda: load_transcription_model(model_name, compute_type)[0],
+        size_mb=estimate_model_size_mb(model_name, compute_type)
+    ) as model:
+        yield model, device
+
+_alignment_models = ModelRegistry(
+    name="alignment",
+    max_entries=int(os.getenv('WHISPER_ALIGN_CACHE_LANGUAGES', '2')),
+    ttl_seconds=float(os.getenv('WHISPER_ALIGN_CACHE_TTL', '1800')),
+    on_evict=unload_model,
+)
+
+@contextlib.contextmanager
+def alignment_model(language_code, device):
+    """
+    Leases the wav2vec2 alignment model for a language from the process-wide
+    registry. Yields (model_a, metadata).
+    """
+    key = (language_code, device)
+    with _alignment_models.lease(
+        key,
+        lambda: whisperx.load_align_model(language_code=language_code, device=device)
+    ) as (model_a, metadata):
+        yield model_a, metadata
+
+TRANSCRIPT_CACHE_VERSION = 1
+
+_transcript_cache = TieredCache(
+    name="transcripts",
+    local_dir=os.getenv('TRANSCRIPT_CACHE_DIR', '/tmp/shorts-cache'),
+    version=TRANSCRIPT_CACHE_VERSION,
+    max_age_seconds=float(os.getenv('TRANSCRIPT_CACHE_MAX_AGE', str(30 * 24 * 3600))),
+    max_local_mb=float(os.getenv('TRANSCRIPT_CACHE_LOCAL_MB', '512')),
+)
+
+def _whisperx_version():
+    try:
+        return version("whisperx")
+    except PackageNotFoundError:
+        return "unknown"
+
+def hash_decoded_audio(input_file, sr=SAMPLE_RATE):
+    """
+    SHA-256 of the input decoded to mono 16 kHz float32 PCM, so re-muxed or
+    re-uploaded copies of the same audio share a key. Reads the shared
+    extracted buffer when there is one, otherwise streams a decode through
+    ffmpeg without keeping it.
+    """
+    digest = hashlib.sha256()
+    shared_path = extracted_path(input_file)
+    if os.path.exists(shared_path):
+        with open(shared_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    cmd = [
+        "ffmpeg", "-nostdin",
+        "-threads", "0",
+        "-i", input_file,
+        "-f", "f32le",
+        "-ac", "1",
+        "-acodec", "pcm_f32le",
+        "-ar", str(sr),
+        "-"
+    ]
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        for block in iter(lambda: process.stdout.read(1 << 20), b""):
+            digest.update(block)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {input_file}")
+    return digest.hexdigest()
+
+def transcript_cache_key(input_file, model_name, compute_type):
+    audio_hash = hash_decoded_audio(input_file)
+    parts = [audio_hash, model_name, compute_type, _whisperx_version()]
+    return hashlib.sha256(":".join(parts).encode("utf-8")).hexdigest()
+
+def restore_cached_transcript(input_file, output_folder, model_name, compute_type, cache_prefix=None):
+    """
+    Writes the cached transcript for input_file into output_folder when one
+    exists. Returns the cache key for a later store_cached_transcript, and
+    whether the transcript was restored.
+    """
+    if os.getenv('TRANSCRIPT_CACHE_ENABLED', 'true').lower() != 'true':
+        return None, False
+
+    try:
+        key = transcript_cache_key(input_file, model_name, compute_type)
+    except Exception as e:
+        print(f"Could not hash {input_file} for the transcript cache: {e}")
+        return None, False
+
+    cached = _transcript_cache.get(key, bucket_prefix=cache_prefix)
+    if cached is None:
+        return key, False
+
+    json_output_path, tsv_output_path = output_paths(input_file, output_folder)
+    os.makedirs(output_folder, exist_ok=True)
+    with open(json_output_path, "w", encoding="utf-8") as f:
+        json.dump(cached, f, indent=2, ensure_ascii=False)
+    save_as_tsv(cached.get("segments", []), tsv_output_path)
+    print(f"Restored cached transcript for {input_file}")
+    return key, True
+
+def store_cached_transcript(key, input_file, output_folder, cache_prefix=None):
+    if key is None:
+        return
+    json_output_path, _ = output_paths(input_file, output_folder)
     try:
-        transcribe_with_model(model, device, input_file, output_folder)
-    finally:
-        unload_model(model)
+        with open(json_output_path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+    _transcript_cache.put(key, result, bucket_prefix=cache_prefix)
+
+def stage_model_name(stage):
+    """
+    Model used by a pipeline stage: 'discovery' transcribes whole videos only
+    to find segments, 'subtitles' produces the final captions. Both default
+    to WHISPER_MODEL_NAME, else 'tiny' as before; set WHISPER_SUBTITLE_MODEL
+    (e.g. 'large-v3-turbo') to caption with a more accurate model. That also
+    applies to createSubtitlesJob, which transcribes whole uploads with the
+    subtitle model, so it is slower and costs more there.
+    """
+    fallback = os.getenv('WHISPER_MODEL_NAME')
+    if stage == 'discovery':
+        return os.getenv('WHISPER_DISCOVERY_MODEL', fallback or 'tiny')
+    if stage == 'subtitles':
+        return os.getenv('WHISPER_SUBTITLE_MODEL', fallback or 'tiny')
+    raise ValueError(f"Unknown transcription stage: {stage}")
+
+def generate_whisperx(input_file, output_folder, compute_type='int8', cache_prefix=None, model_name=None):
+    model_name = model_name or os.getenv('WHISPER_MODEL_NAME', 'tiny')
+
+    json_output_path, _ = output_paths(input_file, output_folder)
+    if os.path.exists(json_output_path):
+        print(f"Skipping: {json_output_path} already exists.")
+        return
+
+    mode, duration = _transcription_mode(input_file)
+    _transcribe_input(input_file, output_folder, model_name, compute_type, cache_prefix, mode, duration)
+
+def _transcribe_input(input_file, output_folder, model_name, compute_type, cache_prefix, mode, duration):
+    if mode != 'streaming':
+        # Decode once; the cache key, ASR and alignment all read this buffer.
+        extract_audio(input_file)
+
+    cache_key, restored = restore_cached_transcript(input_file, output_folder, model_name, compute_type, cache_prefix)
+    if restored:
+        return
+
+    _generate_whisperx(input_file, output_folder, model_name, compute_type, mode, duration)
+    store_cached_transcript(cache_key, input_file, output_folder, cache_prefix)
+
+def _transcription_mode(input_file, duration=None):
+    """
+    Returns the transcription mode for input_file and its duration (None if
+    unknown), probing the duration unless it is passed in.
+    """
+    streaming_min_seconds = float(os.getenv('WHISPER_STREAMING_MIN_SECONDS', '1800'))
+    parallel_workers = int(os.getenv('WHISPER_PARALLEL_WORKERS', '1'))
+    parallel_min_seconds = float(os.getenv('WHISPER_PARALLEL_MIN_SECONDS', '600'))
+    if duration is None:
+        duration = probe_duration(input_file)
+
+    if duration is None:
+        return 'single', None
+    if parallel_workers > 1 and duration >= parallel_min_seconds:
+        return 'parallel', duration
+    if duration >= streaming_min_seconds:
+        return 'streaming', duration
+    return 'single', duration
+
+def _generate_whisperx(input_file, output_folder, model_name, compute_type, mode, duration=None):
+    if mode == 'parallel':
+        from scripts.parallel_asr import transcribe_parallel
+        parallel_workers = int(os.getenv('WHISPER_PARALLEL_WORKERS', '1'))
+        threads = int(os.getenv('WHISPER_PARALLEL_THREADS', '0')) or None
+        transcribe_parallel(input_file, output_folder, model_name, compute_type, workers=parallel_workers, threads=threads)
+        return
+
+    with transcription_model(model_name, compute_type) as (model, device):
+        if mode == 'streaming':
+            transcribe_streaming(
+                model, device, input_file, output_folder,
+                window_seconds=float(os.getenv('WHISPER_STREAMING_WINDOW_SECONDS', '300')),
+                duration=duration
+            )
+        else:
+            transcribe_with_model(model, device, input_file, output_folder)
+
+def generate_whisperx_batch(input_files, output_folder, compute_type='int8', cache_prefixes=None, model_name=None, durations=None):
+    """
+    Transcribes several inputs. Inputs long enough for the streaming or
+    parallel mode go through it one at a time, so their memory bound holds;
+    only short inputs share decoder batches. durations, when known, saves
+    probing each input again. Each input's extracted PCM is deleted once its
+    transcript is written.
+    """
+    model_name = model_name or os.getenv('WHISPER_MODEL_NAME', 'tiny')
+    cache_prefixes = cache_prefixes or [None] * len(input_files)
+    durations = durations or [None] * len(input_files)
+
+    short = []
+    for input_file, cache_prefix, duration in zip(input_files, cache_prefixes, durations):
+        mode, duration = _transcription_mode(input_file, duration)
+        if mode == 'single':
+            short.append((input_file, cache_prefix))
+            continue
+        json_output_path, _ = output_paths(input_file, output_folder)
+        if not os.path.exists(json_output_path):
+            _transcribe_input(input_file, output_folder, model_name, compute_type, cache_prefix, mode, duration)
+        remove_extracted(input_file)
+
+    pending = []
+    for input_file, cache_prefix in short:
+        extract_audio(input_file)
+        cache_key, restored = restore_cached_transcript(input_file, output_folder, model_name, compute_type, cache_prefix)
+        if restored:
+            remove_extracted(input_file)
+        else:
+            pending.append((input_file, cache_key, cache_prefix))
+
+    if not pending:
+        return
+
+    with transcription_model(model_name, compute_type) as (model, device):
+        transcribe_files_with_model(
+            model, device, [input_file for input_file, _, _ in pending], output_folder, release_audio=True
+        )
+
+    for input_file, cache_key, cache_prefix in pending:
+        store_cached_transcript(cache_key, input_file, output_folder, cache_prefix)
 
 def save_as_tsv(segments, path):
     with open(path, 'w', newline='', encoding='utf-8') as f: